@@ -0,0 +1,146 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import time
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+from optimizer.qlearning_kmeans import Q_learningv2
+from optimizer.utils import network_clustering
+from scenario import generate_scenario, get_experiment_row, get_nb_row, get_node_pos, get_target
+from simulator.mobilecharger.mobilecharger import MobileCharger
+from simulator.network import utils
+from simulator.network.network import Network
+from simulator.network.utils import count_package_function
+from simulator.node.node import Node
+
+
+def best_time(func, repeat):
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed)
+
+
+def run_benchmark(name, experiment, node_pos, target, seed=0, nb_second=20, nb_decision=5, repeat=3,
+                  com_func=utils.uniform_com_func):
+    """
+    measure the hot paths on one network
+    :param name: name of the network in the results
+    :param experiment: row of an experiment file with the parameters of the network
+    :param node_pos: locations of the sensors
+    :param target: ids of the targets
+    :param nb_second: number of simulated seconds timed before and after the partition
+    :param nb_decision: number of optimizer decisions timed
+    :param repeat: number of repetitions of the short measurements, the best one is kept
+    :return: dictionary of results
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    energy = experiment.energy
+
+    def build():
+        list_node = [Node(location=location, com_ran=experiment.commRange, energy=energy, energy_max=energy, id=i,
+                          energy_thresh=0.4 * energy, prob=experiment.freq) for i, location in enumerate(node_pos)]
+        mc_list = [MobileCharger(i, energy=experiment.E_mc, capacity=experiment.E_max, e_move=experiment.e_move,
+                                 e_self_charge=experiment.e_mc, velocity=experiment.velocity,
+                                 depot_state=experiment.charge_pos) for i in range(experiment.nb_mc)]
+        return Network(list_node=list_node, mc_list=mc_list, target=target, package_size=experiment.package,
+                       experiment="benchmark_{}_0".format(name), com_func=com_func)
+
+    result = {"network": name, "nb_node": len(node_pos), "nb_target": len(target)}
+    start = time.perf_counter()
+    net = build()
+    result["network_init_s"] = time.perf_counter() - start
+    q_learning = Q_learningv2(nb_action=experiment.charge_pos, alpha=experiment.q_alpha,
+                              q_alpha=experiment.qt_alpha, q_gamma=experiment.qt_gamma)
+
+    result["count_package_function_s"] = best_time(lambda: count_package_function(net), repeat)
+
+    start = time.perf_counter()
+    for t in range(1, nb_second + 1):
+        net.run_per_second(t, q_learning)
+    result["idle_sim_second_per_s"] = nb_second / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    q_learning.action_list = network_clustering(q_learning, network=net, nb_cluster=q_learning.nb_action)
+    result["network_clustering_s"] = time.perf_counter() - start
+    net.set_charging_pos(q_learning.action_list)
+    net.active = True
+
+    # a fixed share of the sensors fall below their threshold, so that every decision has requests to serve
+    t = 201
+    for node_id in random.sample(range(len(net.node)), max(1, len(net.node) // 20)):
+        node = net.node[node_id]
+        node.energy = random.uniform(0.1, 0.9) * node.energy_thresh
+        node.request(q_learning, t)
+    elapsed = []
+    for i in range(nb_decision):
+        mc = net.mc_list[i % len(net.mc_list)]
+        start = time.perf_counter()
+        q_learning.update(mc, net, t)
+        elapsed.append(time.perf_counter() - start)
+    result["q_update_s"] = float(np.mean(elapsed))
+
+    start = time.perf_counter()
+    for t in range(t + 1, t + nb_second + 1):
+        net.run_per_second(t, q_learning)
+    result["active_sim_second_per_s"] = nb_second / (time.perf_counter() - start)
+    return result
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the simulator and optimizer hot paths.')
+    parser.add_argument('--experiments', nargs='*', default=['node', 'target'],
+                        help='experiment files in ./data whose rows are benchmarked')
+    parser.add_argument('--sizes', nargs='*', type=int, default=[2000, 10000, 50000],
+                        help='number of sensors of the synthetic networks')
+    parser.add_argument('--seconds', type=int, default=20, help='simulated seconds timed per phase')
+    parser.add_argument('--decisions', type=int, default=5, help='optimizer decisions timed')
+    parser.add_argument('--repeat', type=int, default=3, help='repetitions of the short measurements')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--com-func', default='uniform_com_func', choices=utils.COM_FUNCS)
+    parser.add_argument('--output', default='log/benchmark.json')
+    args = parser.parse_args()
+
+    for folder in ['log', 'fig']:
+        os.makedirs(folder, exist_ok=True)
+    networks = []
+    for experiment_type in args.experiments:
+        for experiment_index in range(get_nb_row(experiment_type)):
+            networks.append(("{}_{}".format(experiment_type, experiment_index),
+                             get_experiment_row(experiment_type, experiment_index)))
+    for nb_node in args.sizes:
+        # synthetic fields at the density of the 900-node experiments
+        param, node_pos, target = generate_scenario(nb_node, field_size=1000 * math.sqrt(nb_node / 900), seed=args.seed)
+        networks.append(("synthetic_{}".format(nb_node), pd.Series({**param, 'node_pos': node_pos, 'target': target})))
+
+    results = []
+    for name, experiment in networks:
+        node_pos, target = get_node_pos(experiment), get_target(experiment)
+        print('[Benchmark] {} ({} sensors)'.format(name, len(node_pos)))
+        results.append(run_benchmark(name, experiment, node_pos, target, seed=args.seed, nb_second=args.seconds,
+                                     nb_decision=args.decisions, repeat=args.repeat,
+                                     com_func=getattr(utils, args.com_func)))
+        print(tabulate([[key, value] for key, value in results[-1].items()], headers=['Measure', 'Value']), '\n')
+
+    with open(args.output, "w") as f:
+        json.dump({"commit": get_commit(), "python": platform.python_version(), "time": time.time(),
+                   "parameters": vars(args), "results": results}, f, indent=2)
+    print('[Benchmark] Results written to {}'.format(args.output))
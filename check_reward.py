@@ -0,0 +1,158 @@
+import argparse
+import random
+import sys
+
+import numpy as np
+from scipy.spatial import distance
+from tabulate import tabulate
+
+from optimizer.qlearning_kmeans import Q_learningv2
+from optimizer.utils import network_clustering, reward_function, batch_reward_function, get_charging_time, \
+    get_charge_per_sec
+from scenario import get_experiment_row, get_node_pos, get_target
+from simulator.mobilecharger.mobilecharger import MobileCharger
+from simulator.network import parameter as para
+from simulator.network.network import Network
+from simulator.node.node import Node
+
+
+def get_charging_time_scan(network=None, mc=None, q_learning=None, time_stem=0, state=None, alpha=0.1):
+    """
+    get_charging_time as it was before the sort-and-sweep: every crossing time is tried on every sensor, O(T.N)
+    """
+    time_move = distance.euclidean(mc.current, q_learning.action_list[state]) / mc.velocity
+    energy_min = network.node[0].energy_thresh + alpha * network.node[0].energy_max
+    s1 = []  # list of node in request list which has positive charge
+    s2 = []  # list of node not in request list which has negative charge
+    for node in network.node:
+        d = distance.euclidean(q_learning.action_list[state], node.location)
+        p = para.alpha / (d + para.beta) ** 2
+        p1 = 0
+        for other_mc in network.mc_list:
+            if other_mc.id != mc.id and other_mc.get_status() == "charging":
+                d = distance.euclidean(other_mc.current, node.location)
+                p1 += (para.alpha / (d + para.beta) ** 2) * (other_mc.end_time - time_stem)
+            elif other_mc.id != mc.id and other_mc.get_status() == "moving" and other_mc.state != len(q_learning.q_table) - 1:
+                d = distance.euclidean(other_mc.end, node.location)
+                p1 += (para.alpha / (d + para.beta) ** 2) * (other_mc.end_time - other_mc.arrival_time)
+        if node.energy - time_move * node.avg_energy + p1 < energy_min and p - node.avg_energy > 0:
+            s1.append((node.id, p, p1))
+        if node.energy - time_move * node.avg_energy + p1 > energy_min and p - node.avg_energy < 0:
+            s2.append((node.id, p, p1))
+    t = []
+    for index, p, p1 in s1 + s2:
+        t.append((energy_min - network.node[index].energy + time_move * network.node[index].avg_energy - p1) / (
+                p - network.node[index].avg_energy))
+    dead_list = []
+    for item in t:
+        nb_dead = 0
+        for index, p, p1 in s1 + s2:
+            temp = network.node[index].energy - time_move * network.node[index].avg_energy + p1 + (
+                    p - network.node[index].avg_energy) * item
+            if temp < energy_min:
+                nb_dead += 1
+        dead_list.append(nb_dead)
+    if dead_list:
+        return t[np.argmin(dead_list)]
+    return 0
+
+
+def get_error(value, reference):
+    """
+    :return: largest difference relative to the magnitude of the reference
+    """
+    value, reference = np.asarray(value, dtype=float), np.asarray(reference, dtype=float)
+    return float(np.max(np.abs(value - reference), initial=0.0) / max(np.max(np.abs(reference), initial=0.0), 1.0))
+
+
+def build_decision(experiment, node_pos, target, seed=0, nb_request=40, t=700):
+    """
+    network in the middle of a run: sensors with an average energy, nb_request of them requesting, one mc charging
+    and one moving while mc #0 decides at a charging position
+    :return: network, optimizer, deciding mc
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    energy = experiment.energy
+    list_node = [Node(location=location, com_ran=experiment.commRange, energy=energy, energy_max=energy, id=i,
+                      energy_thresh=0.4 * energy, prob=experiment.freq) for i, location in enumerate(node_pos)]
+    mc_list = [MobileCharger(i, energy=experiment.E_mc, capacity=experiment.E_max, e_move=experiment.e_move,
+                             e_self_charge=experiment.e_mc, velocity=experiment.velocity,
+                             depot_state=experiment.charge_pos) for i in range(max(experiment.nb_mc, 3))]
+    net = Network(list_node=list_node, mc_list=mc_list, target=target, package_size=experiment.package,
+                  experiment="check_reward_0", plot="off")
+    q_learning = Q_learningv2(nb_action=experiment.charge_pos, alpha=experiment.q_alpha,
+                              q_alpha=experiment.qt_alpha, q_gamma=experiment.qt_gamma)
+    # energy used before the partition at 200s, then until t
+    for node in net.node:
+        node.used_energy = random.uniform(0.0, 0.2)
+    q_learning.action_list = network_clustering(q_learning, network=net, nb_cluster=q_learning.nb_action)
+    net.set_charging_pos(q_learning.action_list)
+    net.active = True
+    for node in net.node:
+        node.used_energy = random.uniform(0.0, 0.5)
+        node.set_check_point(t)
+    for node_id in random.sample(range(len(net.node)), min(nb_request, len(net.node))):
+        node = net.node[node_id]
+        node.energy = random.uniform(0.01, 0.9) * node.energy_thresh
+        # drained fast enough in the last second that the far charging positions leave some of them dead
+        node.used_energy = random.uniform(0.0, 0.05)
+        node.request(q_learning, t + 1)
+
+    action = q_learning.action_list
+    charging_mc, moving_mc, mc = net.mc_list[1], net.mc_list[2], net.mc_list[0]
+    charging_mc.is_active, charging_mc.is_stand, charging_mc.state = True, True, 5 % len(action)
+    charging_mc.start = charging_mc.current = charging_mc.end = action[charging_mc.state]
+    charging_mc.arrival_time, charging_mc.end_time = t, t + 300
+    moving_mc.is_active, moving_mc.is_stand, moving_mc.state = True, False, 9 % len(action)
+    moving_mc.start, moving_mc.current, moving_mc.end = action[3 % len(action)], (300.0, 300.0), action[moving_mc.state]
+    moving_mc.arrival_time, moving_mc.end_time = t + 100, t + 500
+    mc.is_active, mc.is_stand, mc.state = True, True, 12 % len(action)
+    mc.start = mc.current = mc.end = action[mc.state]
+    q_learning.set_paths(net)
+    return net, q_learning, mc, t + 1
+
+
+def check_reward(net, q_learning, mc, t, nb_state=None):
+    """
+    compare the batched reward path with reward_function state by state, and get_charging_time with the O(T.N) scan
+    :param nb_state: number of states compared with the scan, all of them if None
+    :return: list of (quantity, largest relative error)
+    """
+    nb_state = len(q_learning.q_table) if nb_state is None else min(nb_state, len(q_learning.q_table))
+    first, second, third, charging_time = batch_reward_function(net, mc, q_learning, t)
+    reference = np.asarray([reward_function(net, mc, q_learning, state, t) for state in range(len(q_learning.q_table))])
+    position = np.asarray(q_learning.action_list, dtype=float)
+    charge_rate = np.asarray([para.alpha / (np.linalg.norm(net.node_state.location[q_learning.list_request.ids]
+                                                           - position[state], axis=1) + para.beta) ** 2
+                              for state in range(len(q_learning.q_table))])
+    scan = [get_charging_time_scan(net, mc, q_learning, t, state, q_learning.alpha) for state in range(nb_state)]
+    sweep = [get_charging_time(net, mc, q_learning, t, state, q_learning.alpha) for state in range(nb_state)]
+    return [("first term", get_error(first, reference[:, 0])),
+            ("second term", get_error(second, reference[:, 1])),
+            ("third term", get_error(third, reference[:, 2])),
+            ("charging time", get_error(charging_time, reference[:, 3])),
+            ("charge rate of the requests", get_error([get_charge_per_sec(net, q_learning, state)
+                                                       for state in range(len(q_learning.q_table))], charge_rate)),
+            ("charging time against the scan", get_error(sweep, scan))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check the batched reward path against the per-state one.')
+    parser.add_argument('--type', default='node', help='experiment file in ./data')
+    parser.add_argument('--index', type=int, default=0, help='row of the experiment file')
+    parser.add_argument('--requests', type=int, default=40, help='number of requesting sensors')
+    parser.add_argument('--states', type=int, default=None,
+                        help='states compared with the O(T.N) charging time scan, all of them by default')
+    parser.add_argument('--tolerance', type=float, default=1e-9, help='largest relative error accepted')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    experiment = get_experiment_row(args.type, args.index)
+    net, q_learning, mc, t = build_decision(experiment, get_node_pos(experiment), get_target(experiment),
+                                            seed=args.seed, nb_request=args.requests)
+    result = check_reward(net, q_learning, mc, t, nb_state=args.states)
+    print(tabulate([[name, error, "ok" if error <= args.tolerance else "FAILED"] for name, error in result],
+                   headers=['Quantity', 'Relative error', '']))
+    if any(error > args.tolerance for _, error in result):
+        sys.exit(1)
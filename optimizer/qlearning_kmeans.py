@@ -1,12 +1,24 @@
 import numpy as np
 from scipy.spatial import distance
 
-from optimizer.utils import init_function, q_max_function, reward_function, network_clustering, network_clustering_v2
+from optimizer.utils import init_function, q_max_function, reward_function, batch_reward_function, \
+    network_clustering, network_clustering_v2, network_reclustering, get_cluster_weight, get_weight_drift, \
+    get_all_path, build_path_index
+from optimizer.request import RequestQueue
+from simulator.network import parameter as para
 from simulator.node.utils import find_receiver
 
 
+def format_cost(cost):
+    """
+    :param cost: clustering cost, None when the clustering function does not report one
+    """
+    return "unknown" if cost is None else "{:.6f}".format(cost)
+
+
 class Q_learningv2:
-    def __init__(self, init_func=init_function, nb_action=80, alpha=0, q_alpha=0.5, q_gamma=0.5, load_checkpoint=False):
+    def __init__(self, init_func=init_function, nb_action=80, alpha=0, q_alpha=0.5, q_gamma=0.5, load_checkpoint=False,
+                 batch_reward=True, recluster_period=None, recluster_drift=None, mini_batch=False):
         self.action_list = []
         self.nb_action = nb_action
         self.q_table = init_func(nb_action=nb_action)
@@ -14,18 +26,32 @@ class Q_learningv2:
         self.charging_time = [0.0 for _ in range(nb_action + 1)]
         self.reward = np.asarray([0.0 for _ in range(nb_action + 1)])
         self.reward_max = [0.0 for _ in range(nb_action + 1)]
-        self.list_request = []
+        self.list_request = RequestQueue()  # requests of the sensors below their threshold, keyed by sensor id
         self.alpha = alpha
         self.q_alpha = q_alpha
         self.q_gamma = q_gamma
+        self.batch_reward = batch_reward  # evaluate the default reward for all states at once
+        self.all_path = None  # paths of the targets at the current decision
+        self.path_index = None  # sensor id -> indices of the paths going through it
+        self.recluster_period = recluster_period  # seconds between two partitions, None to keep the first one
+        self.recluster_drift = recluster_drift  # share of the clustering weight which has to move to re-partition
+        self.mini_batch = mini_batch  # re-partition with MiniBatchKMeans
+        self.clustering_cost = None  # weighted inertia of the last partition
+        self.partition_time = None
+        self.partition_weight = None  # clustering weight of the sensors at the last partition
 
     def update(self, mc, network, time_stem, alpha=0.5, gamma=0.5, q_max_func=q_max_function, reward_func=reward_function):
         if not len(self.list_request):
             return self.action_list[mc.state], 0.0
 
-        self.set_reward(mc=mc,time_stem=time_stem, reward_func=reward_func, network=network)
-        self.q_table[mc.state] = (1 - self.q_alpha) * self.q_table[mc.state] + self.q_alpha * (
-                self.reward + self.q_gamma * self.q_max(mc, q_max_func))
+        profiler = network.profiler
+        with profiler.phase("mc_run.update.set_paths"):
+            self.set_paths(network)
+        with profiler.phase("mc_run.update.set_reward"):
+            self.set_reward(mc=mc,time_stem=time_stem, reward_func=reward_func, network=network)
+        with profiler.phase("mc_run.update.q_table"):
+            self.q_table[mc.state] = (1 - self.q_alpha) * self.q_table[mc.state] + self.q_alpha * (
+                    self.reward + self.q_gamma * self.q_max(mc, q_max_func))
         # print(self.q_table)
         self.choose_next_state(mc, network)
         if mc.state == len(self.action_list) - 1:
@@ -39,16 +65,25 @@ class Q_learningv2:
     def q_max(self, mc, q_max_func=q_max_function):
         return q_max_func(q_table=self.q_table, state=mc.state)
 
+    def set_paths(self, network, receive_func=find_receiver):
+        self.all_path = get_all_path(network, receive_func)
+        self.path_index = build_path_index(self.all_path)
+
     def set_reward(self, mc = None, time_stem=0, reward_func=reward_function, network=None):
-        first = np.asarray([0.0 for _ in self.action_list], dtype=float)
-        second = np.asarray([0.0 for _ in self.action_list], dtype=float)
-        third = np.asarray([0.0 for _ in self.action_list], dtype=float)
-        for index, row in enumerate(self.q_table):
-            temp = reward_func(network=network, mc=mc, q_learning=self, state=index, time_stem=time_stem, receive_func=find_receiver)
-            first[index] = temp[0]
-            second[index] = temp[1]
-            third[index] = temp[2]
-            self.charging_time[index] = temp[3]
+        if self.batch_reward and reward_func is reward_function:
+            first, second, third, charging_time = batch_reward_function(network=network, mc=mc, q_learning=self,
+                                                                        time_stem=time_stem, receive_func=find_receiver)
+            self.charging_time = list(charging_time)
+        else:
+            first = np.asarray([0.0 for _ in self.action_list], dtype=float)
+            second = np.asarray([0.0 for _ in self.action_list], dtype=float)
+            third = np.asarray([0.0 for _ in self.action_list], dtype=float)
+            for index, row in enumerate(self.q_table):
+                temp = reward_func(network=network, mc=mc, q_learning=self, state=index, time_stem=time_stem, receive_func=find_receiver)
+                first[index] = temp[0]
+                second[index] = temp[1]
+                third[index] = temp[2]
+                self.charging_time[index] = temp[3]
         first = first / np.sum(first)
         second = second / np.sum(second)
         third = third / np.sum(third)
@@ -65,5 +100,42 @@ class Q_learningv2:
             # print(self.reward_max[mc.state])
             # print(self.action_list[mc.state])
     
-    def net_partition(self, net=None, net_clustering_func=network_clustering):
+    def net_partition(self, net=None, net_clustering_func=network_clustering, t=200):
         self.action_list = net_clustering_func(self, network=net, nb_cluster=self.nb_action)
+        self.partition_time = t
+        self.partition_weight = get_cluster_weight(net)
+        print("[Optimizer] Partition at {}s, clustering cost {}".format(t, format_cost(self.clustering_cost)))
+        net.set_charging_pos(self.action_list)
+
+    def need_partition(self, net, t):
+        """
+        :return: True if the period since the last partition is over or if the clustering weights drifted too much
+        """
+        if self.partition_time is None:
+            return False
+        if self.recluster_period is not None and t - self.partition_time >= self.recluster_period:
+            return True
+        if self.recluster_drift is not None:
+            return get_weight_drift(self.partition_weight, get_cluster_weight(net)) > self.recluster_drift
+        return False
+
+    def net_repartition(self, net=None, t=0):
+        """
+        cluster again from the current charging positions, the positions which barely moved keep their coordinates
+        and their rows and columns of the q-table, the others start again from zero
+        """
+        old_cost = self.clustering_cost
+        charging_pos = network_reclustering(self, network=net, nb_cluster=self.nb_action, mini_batch=self.mini_batch)
+        # the i-th new position is warm-started from the i-th old one, so the states of the mcs keep their index
+        moved = np.linalg.norm(np.asarray(charging_pos, dtype=float) - np.asarray(self.action_list, dtype=float),
+                               axis=1) >= para.recluster_keep
+        self.action_list = [new if is_moved else old
+                            for old, new, is_moved in zip(self.action_list, charging_pos, moved)]
+        self.q_table[moved, :] = 0.0
+        self.q_table[:, moved] = 0.0
+        self.charging_time = [0.0 if is_moved else value for value, is_moved in zip(self.charging_time, moved)]
+        self.partition_time = t
+        self.partition_weight = get_cluster_weight(net)
+        print("[Optimizer] Re-partition at {}s, clustering cost {} (was {}), {} charging positions moved"
+              .format(t, format_cost(self.clustering_cost), format_cost(old_cost), np.count_nonzero(moved)))
+        net.set_charging_pos(self.action_list)
@@ -0,0 +1,121 @@
+import numpy as np
+
+
+class RequestQueue:
+    def __init__(self, capacity=16):
+        """
+        charging requests keyed by sensor id, kept in parallel arrays in arrival order
+        :param capacity: initial length of the arrays, doubled when they are full
+        """
+        self._id = np.zeros(capacity, dtype=int)
+        self._energy = np.zeros(capacity)
+        self._avg_energy = np.zeros(capacity)
+        self._time = np.zeros(capacity)
+        self._is_valid = np.zeros(capacity, dtype=bool)
+        self._size = 0  # used slots, removed requests included until the next compaction
+        self.slot = {}  # sensor id -> slot of its request
+
+    def __len__(self):
+        return len(self.slot)
+
+    def __contains__(self, node_id):
+        return node_id in self.slot
+
+    def __iter__(self):
+        """
+        :return: requests as dictionaries {"id", "energy", "avg_energy", "time"}, in arrival order
+        """
+        self._compact()
+        for index in range(self._size):
+            yield {"id": int(self._id[index]), "energy": float(self._energy[index]),
+                   "avg_energy": float(self._avg_energy[index]), "time": self._time[index].item()}
+
+    @property
+    def ids(self):
+        """
+        :return: ids of the requesting sensors in arrival order, a view which is valid until the queue changes
+        """
+        self._compact()
+        return self._id[:self._size]
+
+    @property
+    def energy(self):
+        self._compact()
+        return self._energy[:self._size]
+
+    @property
+    def avg_energy(self):
+        self._compact()
+        return self._avg_energy[:self._size]
+
+    @property
+    def time(self):
+        self._compact()
+        return self._time[:self._size]
+
+    def push(self, node_id, energy, avg_energy, t):
+        """
+        add the request of a sensor, or update it in place if the sensor already has one
+        :param node_id: id of the sensor
+        :param energy: energy of the sensor when it requests
+        :param avg_energy: average energy of the sensor when it requests
+        :param t: time of the request
+        :return: None
+        """
+        node_id = int(node_id)
+        index = self.slot.get(node_id)
+        if index is None:
+            if self._size == len(self._id):
+                self._compact()
+                if self._size == len(self._id):
+                    self._grow()
+            index = self._size
+            self._size += 1
+            self.slot[node_id] = index
+            self._id[index] = node_id
+            self._is_valid[index] = True
+        self._energy[index] = energy
+        self._avg_energy[index] = avg_energy
+        self._time[index] = t
+
+    def remove(self, node_id):
+        """
+        :return: True if the sensor had a request
+        """
+        index = self.slot.pop(node_id, None)
+        if index is None:
+            return False
+        self._is_valid[index] = False
+        return True
+
+    def remove_many(self, node_id):
+        for item in node_id:
+            self.remove(int(item))
+
+    def clear(self):
+        self._is_valid[:self._size] = False
+        self._size = 0
+        self.slot = {}
+
+    def _grow(self):
+        capacity = 2 * len(self._id)
+        for name in ["_id", "_energy", "_avg_energy", "_time", "_is_valid"]:
+            value = getattr(self, name)
+            grown = np.zeros(capacity, dtype=value.dtype)
+            grown[:len(value)] = value
+            setattr(self, name, grown)
+
+    def _compact(self):
+        """
+        drop the slots of removed requests, the order of the others is kept
+        """
+        if self._size == len(self.slot):
+            return
+        keep = np.flatnonzero(self._is_valid[:self._size])
+        size = len(keep)
+        for name in ["_id", "_energy", "_avg_energy", "_time", "_is_valid"]:
+            value = getattr(self, name)
+            value[:size] = value[keep]
+        self._is_valid[size:self._size] = False
+        self._size = size
+        self.slot = {int(node_id): index for index, node_id in enumerate(self._id[:size])}
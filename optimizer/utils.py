@@ -2,8 +2,6 @@
 from timeit import repeat
 import numpy as np
 from scipy.spatial import distance
-from sklearn.cluster import KMeans
-import matplotlib.pyplot as plt
 import pickle
 
 # Modules
@@ -22,47 +20,88 @@ def reward_function(network, mc, q_learning, state, time_stem, receive_func=find
     w, nb_target_alive = get_weight(network, mc, q_learning, state, charging_time, receive_func)
     p = get_charge_per_sec(network, q_learning, state)
     p_hat = p / np.sum(p)
-    E = np.asarray([network.node[request["id"]].energy for request in q_learning.list_request])
-    e = np.asarray([request["avg_energy"] for request in q_learning.list_request])
+    E = network.node_state.energy[q_learning.list_request.ids]
+    e = q_learning.list_request.avg_energy
     second = nb_target_alive / len(network.target)
     third = np.sum(w * p_hat)
     first = np.sum(e * p / E)
     return first, second, third, charging_time
 
 
+def batch_reward_function(network, mc, q_learning, time_stem, receive_func=find_receiver):
+    """
+    evaluate reward_function for every state at once
+    :return: arrays of the first, second and third reward terms and of the charging times, one entry per state
+    """
+    alpha = q_learning.alpha
+    nb_state = len(q_learning.q_table)
+    p1 = get_other_mc_charge(network, mc, q_learning, time_stem)
+    charging_time = np.asarray([get_charging_time(network, mc, q_learning, time_stem=time_stem, state=state,
+                                                  alpha=alpha, p1=p1) for state in range(nb_state)])
+    request_id = q_learning.list_request.ids
+    p = get_pos_charge_rate(network, q_learning)[:nb_state, request_id]  # charge rate of every request at every state
+    w, nb_target_alive = get_weight_batch(network, mc, q_learning, p, charging_time, receive_func)
+    p_hat = p / np.sum(p, axis=1, keepdims=True)
+    E = network.node_state.energy[request_id]
+    e = q_learning.list_request.avg_energy
+    second = nb_target_alive / len(network.target)
+    third = np.sum(w * p_hat, axis=1)
+    first = np.sum(e * p / E, axis=1)
+    return first, second, third, charging_time
+
+
 def init_function(nb_action=81):
     return np.zeros((nb_action + 1, nb_action + 1), dtype=float)
 
 def get_weight(net, mc, q_learning, action_id, charging_time, receive_func=find_receiver):
     p = get_charge_per_sec(net, q_learning, action_id)
-    all_path = get_all_path(net, receive_func)
-    time_move = distance.euclidean(q_learning.action_list[mc.state],
-                                   q_learning.action_list[action_id]) / mc.velocity
-    list_dead = []
-    w = [0 for _ in q_learning.list_request]
-    for request_id, request in enumerate(q_learning.list_request):
-        temp = (net.node[request["id"]].energy - time_move * request["avg_energy"]) + (
-                p[request_id] - request["avg_energy"]) * charging_time
-        if temp < 0:
-            list_dead.append(request["id"])
-    for request_id, request in enumerate(q_learning.list_request):
-        nb_path = 0
-        for path in all_path:
-            if request["id"] in path:
-                nb_path += 1
-        w[request_id] = nb_path
+    all_path, path_index = get_path_index(net, q_learning, receive_func)
+    time_move = get_travel_time(net, q_learning, mc)[mc.state, action_id]
+    request_id = q_learning.list_request.ids
+    e = q_learning.list_request.avg_energy
+    temp = (net.node_state.energy[request_id] - time_move * e) + (p - e) * charging_time
+    list_dead = request_id[temp < 0].tolist()
+    w = [len(path_index.get(node_id, ())) for node_id in request_id.tolist()]
     total_weight = sum(w) + len(w) * 10 ** -3
     w = np.asarray([(item + 10 ** -3) / total_weight for item in w])
+    cut_path = set()
+    for node_id in list_dead:
+        cut_path.update(path_index.get(node_id, ()))
     nb_target_alive = 0
-    for path in all_path:
-        if para.base in path and not (set(list_dead) & set(path)):
+    for path_id, path in enumerate(all_path):
+        if path[-1] == para.base and path_id not in cut_path:
             nb_target_alive += 1
     return w, nb_target_alive
 
 
+def get_weight_batch(net, mc, q_learning, p, charging_time, receive_func=find_receiver):
+    """
+    evaluate get_weight for every state at once
+    :param p: charge rate of every request at every state
+    :param charging_time: charging time at every state
+    :return: weight of every request, number of targets alive at every state
+    """
+    all_path, path_index = get_path_index(net, q_learning, receive_func)
+    time_move = get_travel_time(net, q_learning, mc)[mc.state, :len(p)]
+    request_id = q_learning.list_request.ids
+    E = net.node_state.energy[request_id]
+    e = q_learning.list_request.avg_energy
+    is_dead = (E - time_move[:, None] * e) + (p - e) * charging_time[:, None] < 0
+    is_on_path = np.zeros((len(all_path), len(request_id)), dtype=bool)
+    for index, node_id in enumerate(request_id):
+        is_on_path[path_index.get(node_id, []), index] = True
+    w = np.sum(is_on_path, axis=0)
+    total_weight = np.sum(w) + len(w) * 10 ** -3
+    w = (w + 10 ** -3) / total_weight
+    is_complete = np.asarray([path[-1] == para.base for path in all_path], dtype=bool)
+    is_cut = (is_dead.astype(int) @ is_on_path.T.astype(int)) > 0
+    nb_target_alive = np.sum(is_complete & ~is_cut, axis=1)
+    return w, nb_target_alive
+
+
 def get_path(net, sensor_id, receive_func=find_receiver):
     path = [sensor_id]
-    if distance.euclidean(net.node[sensor_id].location, para.base) <= net.node[sensor_id].com_ran:
+    if net.routing.in_base_range[sensor_id]:
         path.append(para.base)
     else:
         receive_id = receive_func(net=net, node=net.node[sensor_id])
@@ -78,141 +117,180 @@ def get_all_path(net, receive_func=find_receiver):
     return list_path
 
 
+def build_path_index(all_path):
+    """
+    :param all_path: list of paths
+    :return: dictionary from sensor id to the indices of the paths going through the sensor
+    """
+    path_index = {}
+    for path_id, path in enumerate(all_path):
+        for node_id in path:
+            if node_id != para.base:
+                path_index.setdefault(node_id, []).append(path_id)
+    return path_index
+
+
+def get_path_index(net, q_learning, receive_func=find_receiver):
+    """
+    :return: paths of the current decision and their index, computed once per decision by Q_learningv2.set_paths
+    """
+    if q_learning.all_path is None:
+        all_path = get_all_path(net, receive_func)
+        return all_path, build_path_index(all_path)
+    return q_learning.all_path, q_learning.path_index
+
+
+def get_pos_charge_rate(net, q_learning):
+    """
+    :return: charge rate of every sensor from every charging position, precomputed by the network for the partition
+    """
+    if net.charging_pos is q_learning.action_list:
+        return net.pos_charge_rate
+    position = np.asarray(q_learning.action_list, dtype=float)
+    d = np.linalg.norm(position[:, None, :] - net.node_state.location[None, :, :], axis=2)
+    return para.alpha / (d + para.beta) ** 2
+
+
+def get_travel_time(net, q_learning, mc):
+    """
+    :return: travel time of mc between charging positions, precomputed by the network for the partition
+    """
+    if net.charging_pos is q_learning.action_list:
+        return net.get_travel_time(mc.velocity)
+    position = np.asarray(q_learning.action_list, dtype=float)
+    return np.linalg.norm(position[:, None, :] - position[None, :, :], axis=2) / mc.velocity
+
+
 def get_charge_per_sec(net, q_learning, state):
-    return np.asarray(
-        [para.alpha / (distance.euclidean(net.node[request["id"]].location,
-                                          q_learning.action_list[state]) + para.beta) ** 2 for
-         request in q_learning.list_request])
-
-def get_charging_time(network=None, mc = None, q_learning=None, time_stem=0, state=None, alpha=0.1):
-    # request_id = [request["id"] for request in network.mc.list_request]
-    time_move = distance.euclidean(mc.current, q_learning.action_list[state]) / mc.velocity
+    request_id = q_learning.list_request.ids
+    return get_pos_charge_rate(net, q_learning)[state, request_id]
+
+def get_other_mc_charge(network, mc, q_learning, time_stem):
+    """
+    energy the other mcs are going to give to every sensor
+    :return: one value per sensor, computed once per decision
+    """
+    p1 = np.zeros(len(network.node))
+    for other_mc in network.mc_list:
+        if other_mc.id == mc.id:
+            continue
+        if other_mc.get_status() == "charging":
+            p1 += network.get_charge_rate(other_mc.current, other_mc.state) * (other_mc.end_time - time_stem)
+        elif other_mc.get_status() == "moving" and other_mc.state != len(q_learning.q_table) - 1:
+            p1 += network.get_charge_rate(other_mc.end, other_mc.state) * (other_mc.end_time - other_mc.arrival_time)
+    return p1
+
+
+def get_charging_time(network=None, mc = None, q_learning=None, time_stem=0, state=None, alpha=0.1, p1=None):
+    """
+    find the charging time leaving the fewest sensors below the minimum energy
+    :param p1: energy given by the other mcs to every sensor, see get_other_mc_charge
+    :return: charging time at the state
+    """
+    if network.get_pos_id(mc.current, mc.state) != -1:
+        time_move = get_travel_time(network, q_learning, mc)[mc.state, state]
+    else:
+        time_move = distance.euclidean(mc.current, q_learning.action_list[state]) / mc.velocity
     energy_min = network.node[0].energy_thresh + alpha * network.node[0].energy_max
-    s1 = []  # list of node in request list which has positive charge
-    s2 = []  # list of node not in request list which has negative charge
-    for node in network.node:
-        d = distance.euclidean(q_learning.action_list[state], node.location)
-        p = para.alpha / (d + para.beta) ** 2
-        p1 = 0
-        for other_mc in network.mc_list:
-            if other_mc.id != mc.id and other_mc.get_status() == "charging":
-                d = distance.euclidean(other_mc.current, node.location)
-                p1 += (para.alpha / (d + para.beta) ** 2)*(other_mc.end_time - time_stem)
-            elif other_mc.id != mc.id and other_mc.get_status() == "moving" and other_mc.state != len(q_learning.q_table) - 1:
-                d = distance.euclidean(other_mc.end, node.location)
-                p1 += (para.alpha / (d + para.beta) ** 2)*(other_mc.end_time - other_mc.arrival_time)
-        if node.energy - time_move * node.avg_energy + p1 < energy_min and p - node.avg_energy > 0:
-            s1.append((node.id, p, p1))
-        if node.energy - time_move * node.avg_energy + p1 > energy_min and p - node.avg_energy < 0:
-            s2.append((node.id, p, p1))
-    t = []
-
-    for index, p, p1 in s1:
-        t.append((energy_min - network.node[index].energy + time_move * network.node[index].avg_energy - p1) / (
-                p - network.node[index].avg_energy))
-    for index, p, p1 in s2:
-        t.append((energy_min - network.node[index].energy + time_move * network.node[index].avg_energy - p1) / (
-                p - network.node[index].avg_energy))
-    dead_list = []
-    for item in t:
-        nb_dead = 0
-        for index, p, p1 in s1:
-            temp = network.node[index].energy - time_move * network.node[index].avg_energy + p1 + (
-                        p - network.node[index].avg_energy) * item
-            if temp < energy_min:
-                nb_dead += 1
-        for index, p, p1 in s2:
-            temp = network.node[index].energy - time_move * network.node[index].avg_energy + p1 + (
-                        p - network.node[index].avg_energy) * item
-            if temp < energy_min:
-                nb_dead += 1
-        dead_list.append(nb_dead)
-    if dead_list:
-        arg_min = np.argmin(dead_list)
-        return t[arg_min]
-    return 0
+    if p1 is None:
+        p1 = get_other_mc_charge(network, mc, q_learning, time_stem)
+    node_state = network.node_state
+    p = get_pos_charge_rate(network, q_learning)[state]
+    energy = node_state.energy - time_move * node_state.avg_energy + p1  # energy when the mc starts charging
+    slope = p - node_state.avg_energy
+    s1 = (energy < energy_min) & (slope > 0)  # nodes below energy_min which charging brings back
+    s2 = (energy > energy_min) & (slope < 0)  # nodes above energy_min which keep losing energy
+    order = np.concatenate((np.flatnonzero(s1), np.flatnonzero(s2)))
+    t = (energy_min - node_state.energy + time_move * node_state.avg_energy - p1)[order] / slope[order]
+    if not t.size:
+        return 0
+    # a node of s1 is below energy_min before its crossing time, a node of s2 after it: sweep the sorted times
+    t1 = np.sort(t[:np.count_nonzero(s1)])
+    t2 = np.sort(t[np.count_nonzero(s1):])
+    dead_list = (len(t1) - np.searchsorted(t1, t, side="right")) + np.searchsorted(t2, t, side="left")
+    # at its own crossing time a node sits on energy_min, count it as the rounding of the direct evaluation does
+    dead_list += energy[order] + slope[order] * t < energy_min
+    return t[np.argmin(dead_list)]
 
-def network_clustering(optimizer, network=None, nb_cluster=81):
-    X = []
-    Y = []
-    for node in network.node:
-        node.set_check_point(200)
-        X.append(node.location)
-        Y.append(node.avg_energy**0.5)
-    X = np.array(X)
-    Y = np.array(Y)
-    # print(Y)
-    d = np.linalg.norm(Y)
-    Y = Y/d
-    kmeans = KMeans(n_clusters=nb_cluster, random_state=0).fit(X, sample_weight=Y)
+def get_cluster_weight(network):
+    """
+    :return: weight of every sensor in the clustering, square root of its average energy, 0 for dead sensors; the
+    same weight for every alive sensor while none of them has spent energy yet
+    """
+    node_state = network.node_state
+    is_alive = node_state.energy > 0
+    weight = np.where(is_alive, node_state.avg_energy, 0.0) ** 0.5
+    if not np.any(weight):
+        weight = is_alive.astype(float) if np.any(is_alive) else np.ones(len(weight))
+    return weight / np.linalg.norm(weight)
+
+def get_weight_drift(old_weight, weight):
+    """
+    :return: share of the total clustering weight which moved between two weightings, between 0 and 1
+    """
+    old_total, total = np.sum(old_weight), np.sum(weight)
+    if not old_total or not total:
+        return 1.0
+    return 0.5 * float(np.sum(np.abs(weight / total - old_weight / old_total)))
+
+def get_charging_pos(kmeans):
     charging_pos = []
     for pos in kmeans.cluster_centers_:
         charging_pos.append((int(pos[0]), int(pos[1])))
     charging_pos.append(para.depot)
+    return charging_pos
+
+def network_clustering(optimizer, network=None, nb_cluster=81):
+    network.node_state.set_check_point(np.arange(len(network.node)), 200)
+    X = network.node_state.location
+    Y = get_cluster_weight(network)
+    from sklearn.cluster import KMeans  # imported on first use, it is slow to import in every worker
+    kmeans = KMeans(n_clusters=nb_cluster, random_state=0).fit(X, sample_weight=Y)
+    optimizer.clustering_cost = kmeans.inertia_
+    charging_pos = get_charging_pos(kmeans)
     # print(charging_pos, file=open('log/centroid.txt', 'w'))
     node_distribution_plot(network=network, charging_pos=charging_pos)
     network_plot(network=network, charging_pos=charging_pos)
     return charging_pos
 
 def network_clustering_v2(optimizer, network=None, nb_cluster=81):
-    X = []
-    Y = []
-    min_node = 1000
-    for node in network.node:
-        node.set_check_point(200)
-        if node.avg_energy != 0:
-            min_node = min(min_node, node.avg_energy)
-    for node in network.node:
-        repeat = int(node.avg_energy/min_node)
-        for _ in range(repeat):
-            X.append(node.location)
-            Y.append(node.avg_energy)
-    X = np.array(X)
-    Y = np.array(Y)
-    # print(Y)
+    network.node_state.set_check_point(np.arange(len(network.node)), 200)
+    X = network.node_state.location
+    # weighted by the average energy itself rather than by repeating each location avg_energy / min times
+    Y = network.node_state.avg_energy
     d = np.linalg.norm(Y)
-    Y = Y/d
-    # print(d)
-    # print(Y)
-    kmeans = KMeans(n_clusters=nb_cluster, random_state=0).fit(X)
-    charging_pos = []
-    for pos in kmeans.cluster_centers_:
-        charging_pos.append((int(pos[0]), int(pos[1])))
-    charging_pos.append(para.depot)
+    Y = Y / d if d else np.ones(len(Y))  # uniform while no sensor has spent energy
+    from sklearn.cluster import KMeans
+    kmeans = KMeans(n_clusters=nb_cluster, random_state=0).fit(X, sample_weight=Y)
+    optimizer.clustering_cost = kmeans.inertia_
+    charging_pos = get_charging_pos(kmeans)
     # print(charging_pos, file=open('log/centroid.txt', 'w'))
     # node_distribution_plot(network=network, charging_pos=charging_pos)
     network_plot(network=network, charging_pos=charging_pos)
     return charging_pos
+
+def network_reclustering(optimizer, network=None, nb_cluster=81, mini_batch=False):
+    """
+    cluster the sensors again with their current weights, starting from the current charging positions
+    :param mini_batch: use MiniBatchKMeans, for large networks
+    :return: new charging positions, the i-th one moved from the i-th current one, depot last
+    """
+    X = network.node_state.location
+    Y = get_cluster_weight(network)
+    init = np.asarray(optimizer.action_list[:nb_cluster], dtype=float)
+    if mini_batch:
+        from sklearn.cluster import MiniBatchKMeans
+        kmeans = MiniBatchKMeans(n_clusters=nb_cluster, init=init, n_init=1, random_state=0,
+                                 batch_size=max(1024, 10 * nb_cluster)).fit(X, sample_weight=Y)
+    else:
+        from sklearn.cluster import KMeans
+        kmeans = KMeans(n_clusters=nb_cluster, init=init, n_init=1, random_state=0).fit(X, sample_weight=Y)
+    optimizer.clustering_cost = kmeans.inertia_
+    return get_charging_pos(kmeans)
     
 def node_distribution_plot(network, charging_pos):
-    x_node = []
-    y_node = []
-    c_node = []
-    for node in network.node:
-        x_node.append(node.location[0])
-        y_node.append(node.location[1])
-        c_node.append(node.avg_energy)
-    x_centroid = []
-    y_centroid = []
-    plt.hist(c_node, bins=100)
-    plt.savefig('fig/node_distribution.png')
+    network.plotter.add("node_distribution", avg_energy=network.node_state.avg_energy)
 
 def network_plot(network, charging_pos):
-    x_node = []
-    y_node = []
-    c_node = []
-    for node in network.node:
-        x_node.append(node.location[0])
-        y_node.append(node.location[1])
-        c_node.append(node.avg_energy)
-    x_centroid = []
-    y_centroid = []
-    for centroid in charging_pos:
-        x_centroid.append(centroid[0])
-        y_centroid.append(centroid[1])
-    c_node = np.array(c_node)
-    d = np.linalg.norm(c_node)
-    c_node = c_node / d * 80
-    plt.scatter(x_node, y_node, s = c_node)
-    plt.scatter(x_centroid, y_centroid, c='red', marker='^')
-    plt.savefig('fig/network_plot.png')
+    network.plotter.add("network_plot", location=network.node_state.location,
+                        avg_energy=network.node_state.avg_energy, charging_pos=np.asarray(charging_pos, dtype=float))
@@ -0,0 +1,263 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from ast import literal_eval
+
+import numpy as np
+import pandas as pd
+
+from simulator.network import parameter as para
+
+CACHE_DIR = os.path.join("data", ".cache")
+
+# parameters of the experiments in ./data, used by generate_scenario when they are not given
+PARAMETER = {
+    'energy': 10,
+    'commRange': 80,
+    'freq': 0.5,
+    'charge_pos': 80,
+    'velocity': 5,
+    'E_mc': 500,
+    'E_max': 500,
+    'e_mc': 10,
+    'e_move': 0.01,
+    'nb_mc': 3,
+    'q_alpha': 0.1,
+    'package': 500,
+    'qt_alpha': 0.5,
+    'qt_gamma': 0.5,
+}
+COUNT_PARAMETER = ['charge_pos', 'nb_mc', 'package']  # integer parameters, the others are physical quantities
+
+
+def save_scenario(file_name, param, node_pos, target):
+    """
+    write a scenario as arrays plus a json header with its scalar parameters
+    :param param: dictionary of the parameters, with the column names of the experiment files
+    :param node_pos: array of shape (number of sensors, 2)
+    :param target: ids of the targets
+    :return: None
+    """
+    os.makedirs(os.path.dirname(file_name) or '.', exist_ok=True)
+    with open(file_name + ".tmp", "wb") as f:
+        np.savez(f, param=np.asarray(json.dumps(param)), node_pos=np.asarray(node_pos).reshape(-1, 2),
+                 target=np.asarray(target, dtype=int))
+    os.replace(file_name + ".tmp", file_name)
+
+
+def load_scenario(file_name):
+    """
+    :param file_name: .npz scenario
+    :return: experiment row with the same fields as a row of the experiment files, node_pos and target as arrays
+    """
+    with np.load(file_name, allow_pickle=False) as data:
+        experiment = json.loads(str(data["param"]))
+        experiment["node_pos"] = data["node_pos"]
+        experiment["target"] = data["target"]
+    return pd.Series(experiment)
+
+
+def generate_scenario(nb_node, field_size=1000.0, distribution="uniform", target_fraction=2 / 3, nb_cluster=5,
+                      seed=0, **param):
+    """
+    random sensor field centered on the base station
+    :param nb_node: number of sensors
+    :param field_size: side of the square field
+    :param distribution: "uniform", "normal" (denser around the base) or "cluster" (gaussian hot spots)
+    :param target_fraction: share of the sensors which are targets
+    :param nb_cluster: number of hot spots of the "cluster" distribution
+    :param seed: seed of the positions and targets
+    :param param: parameters overriding PARAMETER, e.g. nb_mc or energy
+    :return: parameters, node positions, target ids
+    """
+    rng = np.random.default_rng(seed)
+    half = field_size / 2
+    if distribution == "uniform":
+        node_pos = rng.uniform(-half, half, size=(nb_node, 2))
+    elif distribution == "normal":
+        node_pos = np.clip(rng.normal(0.0, field_size / 4, size=(nb_node, 2)), -half, half)
+    elif distribution == "cluster":
+        center = rng.uniform(-half, half, size=(nb_cluster, 2))
+        node_pos = center[rng.integers(nb_cluster, size=nb_node)]
+        node_pos = np.clip(node_pos + rng.normal(0.0, field_size / (4 * nb_cluster), size=(nb_node, 2)), -half, half)
+    else:
+        raise ValueError("unknown distribution {}".format(distribution))
+    node_pos = node_pos + np.asarray(para.base)
+    target = np.sort(rng.choice(nb_node, size=int(nb_node * target_fraction), replace=False))
+    scenario_param = dict(PARAMETER)
+    scenario_param.update(param)
+    scenario_param.update({'field_size': field_size, 'distribution': distribution, 'seed': seed})
+    return scenario_param, node_pos, target
+
+
+def get_scenario_file(experiment_type, experiment_index):
+    return os.path.join("data", experiment_type, "{}.npz".format(experiment_index))
+
+
+def is_scenario(experiment_type, experiment_index):
+    """
+    :return: True if the row has a scenario file which is not older than its experiment file
+    """
+    scenario_file = get_scenario_file(experiment_type, experiment_index)
+    csv_file = os.path.join("data", experiment_type + ".csv")
+    if not os.path.exists(scenario_file):
+        return False
+    return not os.path.exists(csv_file) or os.path.getmtime(scenario_file) >= os.path.getmtime(csv_file)
+
+
+def get_file_hash(file_name):
+    sha = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def write_json(file_name, value):
+    with open(file_name + ".tmp", "w") as f:
+        json.dump(value, f)
+    os.replace(file_name + ".tmp", file_name)
+
+
+def build_cache(csv_file, cache, key):
+    """
+    parse every row of an experiment file once into data/.cache/<type>: one json file of parameters and two .npy
+    arrays per row, and key.json written last
+    """
+    df = pd.read_csv(csv_file)
+    tmp = "{}.tmp{}".format(cache, os.getpid())
+    os.makedirs(tmp, exist_ok=True)
+    for experiment_index in range(len(df)):
+        experiment = df.iloc[experiment_index]
+        param = {name: value.item() if hasattr(value, 'item') else value
+                 for name, value in experiment.drop(['node_pos', 'target']).items()}
+        write_json(os.path.join(tmp, "param_{}.json".format(experiment_index)), param)
+        np.save(os.path.join(tmp, "node_pos_{}.npy".format(experiment_index)),
+                np.asarray(get_node_pos(experiment)).reshape(-1, 2))
+        np.save(os.path.join(tmp, "target_{}.npy".format(experiment_index)),
+                np.asarray(get_target(experiment), dtype=int))
+    write_json(os.path.join(tmp, "key.json"), dict(key, nb_row=len(df)))
+    shutil.rmtree(cache, ignore_errors=True)
+    try:
+        os.replace(tmp, cache)
+    except OSError:
+        # another process has just written the same cache
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def get_cache(experiment_type):
+    """
+    :return: cache directory of data/<type>.csv, rebuilt when the file changed
+    """
+    csv_file = os.path.join("data", experiment_type + ".csv")
+    cache = os.path.join(CACHE_DIR, experiment_type)
+    key_file = os.path.join(cache, "key.json")
+    stat = os.stat(csv_file)
+    key = {'mtime': stat.st_mtime, 'size': stat.st_size}
+    if os.path.exists(key_file):
+        with open(key_file) as f:
+            cache_key = json.load(f)
+        if cache_key['mtime'] == key['mtime'] and cache_key['size'] == key['size']:
+            return cache
+        # the file was touched or copied, its content decides
+        key['hash'] = get_file_hash(csv_file)
+        if cache_key.get('hash') == key['hash']:
+            write_json(key_file, dict(cache_key, **key))
+            return cache
+    else:
+        key['hash'] = get_file_hash(csv_file)
+    build_cache(csv_file, cache, key)
+    return cache
+
+
+def load_cached_row(experiment_type, experiment_index):
+    """
+    :return: one row of data/<type>.csv, with node_pos and target memory-mapped from the cache
+    """
+    cache = get_cache(experiment_type)
+    with open(os.path.join(cache, "param_{}.json".format(experiment_index))) as f:
+        experiment = json.load(f)
+    experiment["node_pos"] = np.load(os.path.join(cache, "node_pos_{}.npy".format(experiment_index)), mmap_mode="r")
+    experiment["target"] = np.load(os.path.join(cache, "target_{}.npy".format(experiment_index)), mmap_mode="r")
+    return pd.Series(experiment)
+
+
+def get_experiment_row(experiment_type, experiment_index):
+    """
+    :return: one experiment row, read from data/<type>/<index>.npz if it exists else from data/<type>.csv through
+    its cache
+    """
+    if is_scenario(experiment_type, experiment_index):
+        return load_scenario(get_scenario_file(experiment_type, experiment_index))
+    return load_cached_row(experiment_type, experiment_index)
+
+
+def get_nb_row(experiment_type):
+    csv_file = os.path.join("data", experiment_type + ".csv")
+    if os.path.exists(csv_file):
+        with open(os.path.join(get_cache(experiment_type), "key.json")) as f:
+            return json.load(f)['nb_row']
+    return len([name for name in os.listdir(os.path.join("data", experiment_type)) if name.endswith(".npz")])
+
+
+def get_node_pos(experiment):
+    """
+    :return: list of sensor locations, from the string of an experiment file or the array of a scenario
+    """
+    if isinstance(experiment.node_pos, str):
+        return list(literal_eval(experiment.node_pos))
+    return [tuple(location) for location in experiment.node_pos.tolist()]
+
+
+def get_target(experiment):
+    if isinstance(experiment.target, str):
+        return [int(item) for item in experiment.target.split(',')]
+    return experiment.target.tolist()
+
+
+def convert_experiment(experiment_type):
+    """
+    write every row of data/<type>.csv as data/<type>/<index>.npz
+    :return: number of rows converted
+    """
+    df = pd.read_csv(os.path.join("data", experiment_type + ".csv"))
+    for experiment_index in range(len(df)):
+        experiment = df.iloc[experiment_index]
+        param = {key: value.item() if hasattr(value, 'item') else value
+                 for key, value in experiment.drop(['node_pos', 'target']).items()}
+        save_scenario(get_scenario_file(experiment_type, experiment_index), param,
+                      np.asarray(get_node_pos(experiment)), get_target(experiment))
+    return len(df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate scenarios or convert experiment files into scenarios.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    generate = subparsers.add_parser('generate', help='write data/<name>/<index>.npz for index in range(count)')
+    generate.add_argument('name')
+    generate.add_argument('--nodes', type=int, required=True, help='number of sensors')
+    generate.add_argument('--field', type=float, default=1000.0, help='side of the square field')
+    generate.add_argument('--distribution', default='uniform', choices=['uniform', 'normal', 'cluster'])
+    generate.add_argument('--target-fraction', type=float, default=2 / 3)
+    generate.add_argument('--count', type=int, default=1, help='number of scenarios, seeded seed, seed + 1, ...')
+    generate.add_argument('--seed', type=int, default=0)
+    for key, value in PARAMETER.items():
+        generate.add_argument('--' + key, type=int if key in COUNT_PARAMETER else float, default=value)
+    convert = subparsers.add_parser('convert', help='write data/<type>/<index>.npz for every row of data/<type>.csv')
+    convert.add_argument('experiment_types', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        for index in range(args.count):
+            param, node_pos, target = generate_scenario(args.nodes, field_size=args.field,
+                                                        distribution=args.distribution,
+                                                        target_fraction=args.target_fraction, seed=args.seed + index,
+                                                        **{key: getattr(args, key) for key in PARAMETER})
+            save_scenario(get_scenario_file(args.name, index), param, node_pos, target)
+        print('[Scenario] {} scenarios written to data/{}'.format(args.count, args.name))
+    else:
+        for experiment_type in args.experiment_types:
+            print('[Scenario] {} rows of data/{}.csv converted'.format(convert_experiment(experiment_type),
+                                                                       experiment_type))
@@ -0,0 +1,108 @@
+import numpy as np
+
+from simulator.network import parameter as para
+
+
+def get_length(vector):
+    return np.hypot(vector[:, 0], vector[:, 1])
+
+
+class MCFleet:
+    def __init__(self, mc_list):
+        """
+        structure-of-arrays storage for the state of every mc of a network
+        :param mc_list: list of mcs, the i-th mc is bound to row i
+        """
+        nb_mc = len(mc_list)
+        self.mc_list = mc_list
+        self.start = np.asarray([mc.start for mc in mc_list], dtype=float).reshape(nb_mc, 2)
+        self.end = np.asarray([mc.end for mc in mc_list], dtype=float).reshape(nb_mc, 2)
+        self.current = np.asarray([mc.current for mc in mc_list], dtype=float).reshape(nb_mc, 2)
+        self.energy = np.asarray([mc.energy for mc in mc_list], dtype=float)
+        self.capacity = np.asarray([mc.capacity for mc in mc_list], dtype=float)
+        self.e_move = np.asarray([mc.e_move for mc in mc_list], dtype=float)
+        self.e_self_charge = np.asarray([mc.e_self_charge for mc in mc_list], dtype=float)
+        self.velocity = np.asarray([mc.velocity for mc in mc_list], dtype=float)
+        self.end_time = np.asarray([mc.end_time for mc in mc_list], dtype=float)
+        self.moving_time = np.asarray([mc.moving_time for mc in mc_list], dtype=float)
+        self.arrival_time = np.asarray([mc.arrival_time for mc in mc_list], dtype=float)
+        self.state = np.asarray([mc.state for mc in mc_list], dtype=int)
+        self.is_stand = np.asarray([mc.is_stand for mc in mc_list], dtype=bool)
+        self.is_self_charge = np.asarray([mc.is_self_charge for mc in mc_list], dtype=bool)
+        self.is_active = np.asarray([mc.is_active for mc in mc_list], dtype=bool)
+        for row, mc in enumerate(mc_list):
+            mc.bind(self, row)
+
+    def __len__(self):
+        return len(self.energy)
+
+    def move(self, rows):
+        """
+        advance mcs by one second toward their destination, as get_location and update_location do for one mc
+        :param rows: array of rows of the moving mcs
+        :return: None
+        """
+        start, end, current = self.start[rows], self.end[rows], self.current[rows]
+        time_move = get_length(end - start) / self.velocity[rows]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = current + (end - start) / time_move[:, None]
+        remain = end - current
+        overshoot_x = remain[:, 0] * (end[:, 0] - step[:, 0])
+        is_end = (overshoot_x < 0) | ((overshoot_x == 0) & (remain[:, 1] * (end[:, 1] - step[:, 1]) <= 0))
+        is_end |= get_length(remain) < 10 ** -3
+        location = np.where(is_end[:, None], end, step)
+        self.current[rows] = np.where((time_move == 0)[:, None], current, location)
+        self.energy[rows] -= self.e_move[rows]
+
+    def check_state(self, rows):
+        """
+        vectorized MobileCharger.check_state
+        :param rows: array of rows of the mcs
+        :return: None
+        """
+        end = self.end[rows]
+        is_stand = get_length(self.current[rows] - end) < 1
+        self.is_stand[rows] = is_stand
+        self.current[rows[is_stand]] = end[is_stand]
+        self.is_self_charge[rows] = get_length(end - np.asarray(para.depot, dtype=float)) < 10 ** -3
+
+    def run_batch(self, rows, network, time_stem):
+        """
+        one second of mcs which do not take a decision in it, the same as MobileCharger.run for each of them
+        :param rows: rows of the mcs, in id order
+        :return: None
+        """
+        if not rows:
+            return
+        rows = np.asarray(rows)
+        is_active = self.is_active[rows]
+        is_stand = self.is_stand[rows]
+        is_self_charge = self.is_self_charge[rows]
+        moving = rows[is_active & ~is_stand]
+        if moving.size:
+            self.move(moving)
+        for row in rows[is_active & is_stand & ~is_self_charge]:
+            self.mc_list[row].charge(network)
+        self_charging = rows[is_active & is_stand & is_self_charge]
+        self.energy[self_charging] = np.minimum(self.energy[self_charging] + self.e_self_charge[self_charging],
+                                                self.capacity[self_charging])
+        is_low = (self.energy[rows] < para.E_mc_thresh) & ~self.is_self_charge[rows]
+        for row in rows[is_low]:
+            self.mc_list[row].check_energy(time_stem)
+        self.check_state(rows)
+
+    def run(self, network, time_stem, optimizer):
+        """
+        one second of every mc in id order, the mcs between two decisions are advanced together
+        :return: None
+        """
+        batch = []
+        for row, mc in enumerate(self.mc_list):
+            if mc.is_deciding(time_stem, optimizer):
+                # the decision sees the mcs before it already advanced, as in a loop over MobileCharger.run
+                self.run_batch(batch, network, time_stem)
+                batch = []
+                mc.run(network=network, time_stem=time_stem, net=network, optimizer=optimizer)
+            else:
+                batch.append(row)
+        self.run_batch(batch, network, time_stem)
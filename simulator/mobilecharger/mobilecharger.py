@@ -1,13 +1,32 @@
-import csv
+import math
 from scipy.spatial import distance
 
 from simulator.mobilecharger.utils import get_location, charging
 from simulator.network import parameter as para
+from simulator.utils import state_property, to_point
 
 
 class MobileCharger:
+    start = state_property("start", to_point)
+    end = state_property("end", to_point)
+    current = state_property("current", to_point)
+    energy = state_property("energy", float)
+    capacity = state_property("capacity", float)
+    e_move = state_property("e_move", float)
+    e_self_charge = state_property("e_self_charge", float)
+    velocity = state_property("velocity", float)
+    end_time = state_property("end_time", float)
+    moving_time = state_property("moving_time", float)
+    arrival_time = state_property("arrival_time", float)
+    state = state_property("state", int)
+    is_stand = state_property("is_stand", bool)
+    is_self_charge = state_property("is_self_charge", bool)
+    is_active = state_property("is_active", bool)
+
     def __init__(self, id,  energy=None, e_move=None, start=para.depot, end=para.depot, velocity=None,
                  e_self_charge=None, capacity=None, depot_state=80):
+        self._state = None  # MCFleet of the network, set when the mc is bound
+        self._row = None  # row of this mc in the fleet
         self.id = id
         self.is_stand = False  # is true if mc stand and charge
         self.is_self_charge = False  # is true if mc is charged
@@ -28,6 +47,16 @@ class MobileCharger:
         self.depot_state = depot_state
         self.state = depot_state # Current state in Q_table
 
+    def bind(self, state, row):
+        """
+        turn the mc into a view over one row of a fleet
+        :param state: MCFleet of the network
+        :param row: row of this mc in the fleet
+        :return: None
+        """
+        self._state = state
+        self._row = row
+
     def get_status(self):
         if not self.is_active:
             return "deactivated"
@@ -48,48 +77,60 @@ class MobileCharger:
         self.energy = min(self.energy + self.e_self_charge, self.capacity)
 
     def check_state(self):
-        if distance.euclidean(self.current, self.end) < 1:
+        if math.dist(self.current, self.end) < 1:
             self.is_stand = True
             self.current = self.end
         else:
             self.is_stand = False
-        if distance.euclidean(para.depot, self.end) < 10 ** -3:
+        if math.dist(para.depot, self.end) < 10 ** -3:
             self.is_self_charge = True
         else:
             self.is_self_charge = False
 
     def get_next_location(self, network, time_stem, optimizer=None):
-        next_location, charging_time = optimizer.update(self, network, time_stem)
+        with network.profiler.phase("mc_run.update"):
+            next_location, charging_time = optimizer.update(self, network, time_stem)
         self.start = self.current
         self.end = next_location
         self.moving_time = distance.euclidean(self.start, self.end) / self.velocity
         self.end_time = time_stem + self.moving_time + charging_time
         self.arrival_time = time_stem + self.moving_time
         print("[Mobile Charger] MC #{} moves to {} in {}s and charges for {}s".format(self.id, self.end, self.moving_time, charging_time))
-        with open(network.mc_log_file, "a") as mc_log_file:
-            writer = csv.DictWriter(mc_log_file, fieldnames=['time_stamp', 'id', 'starting_point', 'destination_point', 'decision_id', 'charging_time', 'moving_time'])
-            mc_info = {
-                'time_stamp' : time_stem,
-                'id' : self.id,
-                'starting_point' : self.start,
-                'destination_point' : self.end,
-                'decision_id' : self.state,
-                'charging_time' : charging_time,
-                'moving_time' : self.moving_time
-            }
-            writer.writerow(mc_info)
+        mc_info = {
+            'time_stamp' : time_stem,
+            'id' : self.id,
+            'starting_point' : self.start,
+            'destination_point' : self.end,
+            'decision_id' : self.state,
+            'charging_time' : charging_time,
+            'moving_time' : self.moving_time
+        }
+        if network.mc_log is not None:
+            network.mc_log.write(mc_info)
+
+    def is_deciding(self, time_stem, optimizer):
+        return bool(((not self.is_active) and optimizer.list_request) or abs(time_stem - self.end_time) < 1)
+
+    def check_energy(self, time_stem):
+        """
+        send the mc back to the depot when its energy runs low
+        """
+        if self.energy < para.E_mc_thresh and not self.is_self_charge and self.end != para.depot:
+            self.start = self.current
+            self.end = para.depot
+            self.is_stand = False
+            charging_time = self.capacity / self.e_self_charge
+            moving_time = distance.euclidean(self.start, self.end) / self.velocity
+            self.end_time = time_stem + moving_time + charging_time
 
     def run(self, network, time_stem, net=None, optimizer=None):
         # print(self.energy, self.start, self.end, self.current)
-        if ((not self.is_active) and optimizer.list_request) or abs(time_stem - self.end_time) < 1:
+        if self.is_deciding(time_stem, optimizer):
             self.is_active = True
-            new_list_request = []
-            for request in optimizer.list_request:
-                if net.node[request["id"]].energy < net.node[request["id"]].energy_thresh:
-                    new_list_request.append(request)
-                else:
-                    net.node[request["id"]].is_request = False
-            optimizer.list_request = new_list_request
+            request_id = optimizer.list_request.ids
+            is_charged = ~(net.node_state.energy[request_id] < net.node_state.energy_thresh[request_id])
+            net.node_state.is_request[request_id[is_charged]] = False
+            optimizer.list_request.remove_many(request_id[is_charged])
             if not optimizer.list_request:
                 self.is_active = False
             self.get_next_location(network=network, time_stem=time_stem, optimizer=optimizer)
@@ -104,11 +145,5 @@ class MobileCharger:
                 else:
                     # print("self charging")
                     self.self_charge()
-        if self.energy < para.E_mc_thresh and not self.is_self_charge and self.end != para.depot:
-            self.start = self.current
-            self.end = para.depot
-            self.is_stand = False
-            charging_time = self.capacity / self.e_self_charge
-            moving_time = distance.euclidean(self.start, self.end) / self.velocity
-            self.end_time = time_stem + moving_time + charging_time
+        self.check_energy(time_stem)
         self.check_state()
@@ -20,6 +20,4 @@ def get_location(mc):
 
 
 def charging(mc, net, node):
-    for nd in net.node:
-        p = nd.charge(mc)
-        mc.energy -= p
+    net.charge_sensors(mc)
@@ -0,0 +1,233 @@
+import glob
+import os
+import random
+import numpy as np
+
+from simulator.network import parameter as para
+from simulator.network import utils
+from simulator.utils import to_point
+
+CHECKPOINT_DIR = "checkpoint"
+
+
+def get_checkpoint_prefix(experiment_type, experiment_index, nb_run):
+    return os.path.join(CHECKPOINT_DIR, "checkpoint_{}_{}_{}".format(experiment_type, experiment_index, nb_run))
+
+
+def list_checkpoint(prefix):
+    """
+    :param prefix: prefix of the checkpoint files of one run
+    :return: list of (time, file name) of the checkpoints of the run, oldest first
+    """
+    checkpoint = []
+    for file_name in glob.glob(prefix + "_t*.npz"):
+        checkpoint.append((int(file_name[len(prefix) + 2:-len(".npz")]), file_name))
+    return sorted(checkpoint)
+
+
+def save_npz(file_name, **arrays):
+    """
+    write compressed arrays through a temporary file, so that file_name is either the old or the new checkpoint
+    """
+    with open(file_name + ".tmp", "wb") as f:
+        np.savez_compressed(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(file_name + ".tmp", file_name)
+
+
+def pack_points(points):
+    return np.asarray([tuple(point) for point in points], dtype=float).reshape(-1, 2)
+
+
+def save_static(network, optimizer, file_name):
+    """
+    write what does not change during a run: topology, parameters of the sensors, mcs and optimizer
+    """
+    node = network.node
+    neighbor = network.routing.neighbor
+    mc_list = network.mc_list
+    save_npz(file_name,
+             experiment=np.asarray(network.experiment),
+             location=np.asarray([n.location for n in node]).reshape(-1, 2),
+             com_ran=np.asarray([n.com_ran for n in node], dtype=float),
+             sen_ran=np.asarray([np.nan if n.sen_ran is None else n.sen_ran for n in node], dtype=float),
+             energy_max=network.node_state.energy_max,
+             energy_thresh=network.node_state.energy_thresh,
+             prob=network.node_state.prob,
+             len_cp=np.asarray([n.len_cp for n in node], dtype=int),
+             neighbor_ptr=np.cumsum([0] + [len(row) for row in neighbor]),
+             neighbor=np.concatenate(neighbor + [np.zeros(0, dtype=int)]),
+             target=np.asarray(network.target, dtype=int),
+             package_size=np.asarray(network.package_size),
+             com_func=np.asarray(network.com_func.__name__),
+             flag=np.asarray([network.trace, network.debug, network.columnar_log, network.profiler.enabled]),
+             plot=np.asarray(network.plotter.mode),
+             mc_capacity=np.asarray([mc.capacity for mc in mc_list], dtype=float),
+             mc_e_move=np.asarray([mc.e_move for mc in mc_list], dtype=float),
+             mc_e_self_charge=np.asarray([mc.e_self_charge for mc in mc_list], dtype=float),
+             mc_velocity=np.asarray([mc.velocity for mc in mc_list], dtype=float),
+             mc_depot_state=np.asarray([mc.depot_state for mc in mc_list], dtype=int),
+             q_param=np.asarray([optimizer.alpha, optimizer.q_alpha, optimizer.q_gamma], dtype=float),
+             nb_action=np.asarray(optimizer.nb_action),
+             batch_reward=np.asarray(optimizer.batch_reward),
+             recluster=np.asarray([np.nan if optimizer.recluster_period is None else optimizer.recluster_period,
+                                   np.nan if optimizer.recluster_drift is None else optimizer.recluster_drift,
+                                   optimizer.mini_batch], dtype=float))
+
+
+def save_state(t, network, optimizer, dead_time, file_name):
+    """
+    write the mutable state of a run at time t
+    """
+    state = network.node_state
+    mc_list = network.mc_list
+    request = optimizer.list_request
+    version, internal, gauss = random.getstate()
+    save_npz(file_name,
+             time=np.asarray([t, dead_time]),
+             energy=state.energy,
+             used_energy=state.used_energy,
+             avg_energy=state.avg_energy,
+             is_active=state.is_active,
+             is_request=state.is_request,
+             cp=np.stack([state.cp_energy, state.cp_time, state.cp_avg]),
+             cp_head=state.cp_head,
+             cp_count=state.cp_count,
+             net_flag=np.asarray([network.active, network.package_lost]),
+             mc_flag=np.asarray([[mc.is_stand, mc.is_self_charge, mc.is_active] for mc in mc_list],
+                                dtype=bool).reshape(-1, 3),
+             mc_point=np.stack([pack_points([mc.start for mc in mc_list]), pack_points([mc.end for mc in mc_list]),
+                                pack_points([mc.current for mc in mc_list])]),
+             mc_time=np.asarray([[mc.end_time, mc.moving_time, mc.arrival_time, mc.energy] for mc in mc_list],
+                                dtype=float).reshape(-1, 4),
+             mc_state=np.asarray([mc.state for mc in mc_list], dtype=int),
+             action_list=np.asarray(optimizer.action_list).reshape(-1, 2),
+             q_table=np.asarray(optimizer.q_table),
+             charging_time=np.asarray(optimizer.charging_time, dtype=float),
+             reward=np.asarray(optimizer.reward, dtype=float),
+             reward_max=np.asarray(optimizer.reward_max, dtype=float),
+             partition=np.asarray([np.nan if optimizer.partition_time is None else optimizer.partition_time,
+                                   np.nan if optimizer.clustering_cost is None else optimizer.clustering_cost]),
+             partition_weight=np.zeros(0) if optimizer.partition_weight is None else optimizer.partition_weight,
+             request_id=request.ids,
+             request_value=np.stack([request.energy, request.avg_energy, request.time], axis=1),
+             random_state=np.asarray(internal, dtype=np.uint64),
+             random_param=np.asarray([version, np.nan if gauss is None else gauss], dtype=float))
+
+
+def set_checkpoint(t=0, network=None, optimizer=None, dead_time=0, keep=None):
+    """
+    write a checkpoint of the run, the static part is written once per run
+    :param keep: number of checkpoints kept for each run, the oldest ones are removed, checkpoint_keep of parameter.py
+    if None
+    :return: None
+    """
+    keep = para.checkpoint_keep if keep is None else keep
+    exp_type, exp_index, nb_run = network.experiment.rsplit('_', 2)
+    prefix = get_checkpoint_prefix(exp_type, exp_index, nb_run)
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    if not network.static_saved:
+        # a new run replaces the checkpoints left by an earlier run of the same experiment
+        for _, file_name in list_checkpoint(prefix):
+            os.remove(file_name)
+        save_static(network, optimizer, prefix + "_static.npz")
+        network.static_saved = True
+    for log in [network.net_log, network.mc_log]:
+        if log is not None:
+            log.flush()
+    save_state(t, network, optimizer, dead_time, "{}_t{}.npz".format(prefix, t))
+    for _, file_name in list_checkpoint(prefix)[:-keep]:
+        os.remove(file_name)
+    print("[Simulator] Simulation checkpoint set at {}s".format(t))
+
+
+def load_checkpoint(experiment_type, experiment_index, nb_run):
+    """
+    rebuild a run from its static file and its latest checkpoint, the random module is set back to its saved state
+    :return: dictionary with the same keys as the checkpoints written by earlier versions
+    """
+    from optimizer.qlearning_kmeans import Q_learningv2
+    from simulator.mobilecharger.mobilecharger import MobileCharger
+    from simulator.network.network import Network
+    from simulator.node.node import Node
+
+    prefix = get_checkpoint_prefix(experiment_type, experiment_index, nb_run)
+    checkpoint = list_checkpoint(prefix)
+    if not checkpoint:
+        raise FileNotFoundError("no checkpoint for {}".format(prefix))
+    with np.load(prefix + "_static.npz") as f:
+        static = dict(f)
+    with np.load(checkpoint[-1][1]) as f:
+        state = dict(f)
+
+    list_node = []
+    for i, location in enumerate(static["location"]):
+        sen_ran = None if np.isnan(static["sen_ran"][i]) else float(static["sen_ran"][i])
+        node = Node(location=to_point(location), com_ran=float(static["com_ran"][i]), sen_ran=sen_ran,
+                    energy=float(state["energy"][i]), prob=float(static["prob"][i]), len_cp=int(static["len_cp"][i]),
+                    id=i, is_active=bool(state["is_active"][i]), energy_max=float(static["energy_max"][i]),
+                    energy_thresh=float(static["energy_thresh"][i]))
+        list_node.append(node)
+    ptr = static["neighbor_ptr"]
+    neighbor = [static["neighbor"][ptr[i]:ptr[i + 1]].tolist() for i in range(len(list_node))]
+
+    mc_list = []
+    for i in range(len(static["mc_capacity"])):
+        mc = MobileCharger(i, energy=float(state["mc_time"][i, 3]), capacity=float(static["mc_capacity"][i]),
+                           e_move=float(static["mc_e_move"][i]), e_self_charge=float(static["mc_e_self_charge"][i]),
+                           velocity=float(static["mc_velocity"][i]), depot_state=int(static["mc_depot_state"][i]))
+        mc.is_stand, mc.is_self_charge, mc.is_active = state["mc_flag"][i].tolist()
+        mc.start, mc.end, mc.current = [to_point(point[i]) for point in state["mc_point"]]
+        mc.end_time, mc.moving_time, mc.arrival_time = state["mc_time"][i, :3].tolist()
+        mc.state = int(state["mc_state"][i])
+        mc_list.append(mc)
+
+    trace, debug, columnar_log, profile = static["flag"].tolist()
+    network = Network(list_node=list_node, mc_list=mc_list, target=static["target"].tolist(),
+                      package_size=static["package_size"].item(), experiment=str(static["experiment"]),
+                      com_func=getattr(utils, str(static["com_func"])), trace=trace, debug=debug,
+                      columnar_log=columnar_log, profile=profile, neighbor=neighbor,
+                      plot=str(static["plot"]))
+    network.node_state.used_energy[:] = state["used_energy"]
+    network.node_state.avg_energy[:] = state["avg_energy"]
+    network.node_state.touch("avg_energy", slice(None))
+    network.node_state.cp_energy[:], network.node_state.cp_time[:], network.node_state.cp_avg[:] = state["cp"]
+    network.node_state.cp_head[:] = state["cp_head"]
+    network.node_state.cp_count[:] = state["cp_count"]
+    network.node_state.is_request[:] = state["is_request"]
+    network.active, network.package_lost = state["net_flag"].tolist()
+    network.static_saved = True
+
+    alpha, q_alpha, q_gamma = static["q_param"].tolist()
+    recluster_period, recluster_drift, mini_batch = [None if np.isnan(x) else x for x in static["recluster"].tolist()]
+    optimizer = Q_learningv2(nb_action=int(static["nb_action"]), alpha=alpha, q_alpha=q_alpha, q_gamma=q_gamma,
+                             batch_reward=bool(static["batch_reward"]), recluster_period=recluster_period,
+                             recluster_drift=recluster_drift, mini_batch=bool(mini_batch))
+    optimizer.action_list = [to_point(point) for point in state["action_list"]]
+    optimizer.q_table = state["q_table"]
+    optimizer.charging_time = state["charging_time"].tolist()
+    optimizer.reward = state["reward"]
+    optimizer.reward_max = state["reward_max"].tolist()
+    partition_time, clustering_cost = [None if np.isnan(x) else x for x in state["partition"].tolist()]
+    optimizer.partition_time = None if partition_time is None else int(partition_time)
+    optimizer.clustering_cost = clustering_cost
+    optimizer.partition_weight = state["partition_weight"] if partition_time is not None else None
+    for node_id, (e, avg_e, time) in zip(state["request_id"].tolist(), state["request_value"].tolist()):
+        optimizer.list_request.push(node_id, e, avg_e, time)
+    if optimizer.action_list:
+        network.set_charging_pos(optimizer.action_list)
+
+    version, gauss = state["random_param"].tolist()
+    random.setstate((int(version), tuple(int(x) for x in state["random_state"]), None if np.isnan(gauss) else gauss))
+
+    t, dead_time = state["time"].tolist()
+    return {
+        'time'              : t,
+        'experiment_type'   : experiment_type,
+        'experiment_index'  : experiment_index,
+        'nb_run'            : nb_run,
+        'network'           : network,
+        'optimizer'         : optimizer,
+        'dead_time'         : dead_time
+    }
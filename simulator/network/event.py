@@ -0,0 +1,129 @@
+import math
+import numpy as np
+from scipy.spatial import distance
+
+from simulator.network import parameter as para
+from simulator.network.utils import get_expected_drain
+
+
+def get_charge_rate(net, mc):
+    """
+    :param net: the network
+    :param mc: mobile charger standing at its charging position
+    :return: energy the mc gives to every sensor per second
+    """
+    state = net.node_state
+    p = net.get_charge_rate(mc.current, mc.state).copy()
+    in_range = np.zeros(len(p), dtype=bool)
+    in_range[net.get_charge_range(mc.current, mc.state)] = True
+    p[~state.is_active | (state.energy > state.energy_max - 10 ** -5) | ~in_range] = 0.0
+    return p
+
+
+def is_charging(mc):
+    return mc.is_active and mc.is_stand and not mc.is_self_charge
+
+
+def next_boundary(t, period, offset=1):
+    """
+    :return: first time step after t which is equal to offset modulo period
+    """
+    return t + 1 + (offset - t - 1) % period
+
+
+def ticks_until(value, limit, rate):
+    """
+    number of time steps until value, changing by -rate per step, goes below limit
+    :param value: current values
+    :param limit: limits
+    :param rate: decrease per step, only positive rates cross
+    :return: number of steps, rounded down so that no crossing is missed, inf if the value never crosses
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ticks = np.where((rate > 0) & (value >= limit), np.floor((value - limit) / rate), np.inf)
+    return np.maximum(ticks, 1)
+
+
+def next_event_time(net, optimizer, t, drain, charge, mc_charge, max_time):
+    """
+    find the next time step at which something else than a linear energy change happens
+    :param net: the network
+    :param optimizer: the optimizer
+    :param t: current time
+    :param drain: expected energy spent by every sensor per second
+    :param charge: energy received by every sensor per second
+    :param mc_charge: energy given per second by each mc, 0 if it is not charging
+    :param max_time: last time step of the simulation
+    :return: time step of the next event
+    """
+    state = net.node_state
+    loss = drain - charge
+    candidate = [max_time + 1, next_boundary(t, 100), next_boundary(t, para.checkpoint_period, offset=0)]
+    if t < 200:
+        candidate.append(200)
+    # sensor crossing its threshold downward or upward, reaching zero or reaching its capacity
+    candidate.append(t + np.min(ticks_until(state.energy, state.energy_thresh, loss), initial=np.inf))
+    candidate.append(t + np.min(ticks_until(-state.energy, -state.energy_thresh, -loss), initial=np.inf))
+    candidate.append(t + np.min(ticks_until(state.energy, 0.0, loss), initial=np.inf))
+    candidate.append(t + np.min(ticks_until(-state.energy, 10 ** -5 - state.energy_max, -loss)[charge > 0],
+                                initial=np.inf))
+    if net.active:
+        for mc, p in zip(net.mc_list, mc_charge):
+            if not mc.is_active and optimizer.list_request:
+                candidate.append(t + 1)
+            if mc.end_time >= 0 and math.floor(mc.end_time - 1) + 1 > t:
+                candidate.append(math.floor(mc.end_time - 1) + 1)
+            if mc.is_active and not mc.is_stand:
+                remain = distance.euclidean(mc.current, mc.end)
+                candidate.append(t + max(1, math.floor((remain - 1) / mc.velocity)))
+                candidate.append(t + max(1, math.floor((mc.energy - para.E_mc_thresh) / mc.e_move)))
+            elif p > 0:
+                candidate.append(t + max(1, math.floor((mc.energy - para.E_mc_thresh) / p)))
+    return int(max(t + 1, min(candidate)))
+
+
+def skip_to_next_event(net, optimizer, t, max_time):
+    """
+    advance the network analytically up to the time step before the next event
+    :param net: the network
+    :param optimizer: the optimizer
+    :param t: current time
+    :param max_time: last time step of the simulation
+    :return: time reached, the next event is simulated as a regular time step
+    """
+    state = net.node_state
+    drain = get_expected_drain(net)
+    mc_rate = [get_charge_rate(net, mc) if net.active and is_charging(mc) else None for mc in net.mc_list]
+    charge = np.zeros(len(net.node))
+    for p in mc_rate:
+        if p is not None:
+            charge += p
+    mc_charge = [0.0 if p is None else float(np.sum(p)) for p in mc_rate]
+    dt = next_event_time(net, optimizer, t, drain, charge, mc_charge, max_time) - 1 - t
+    if dt <= 0:
+        return t
+
+    drained = state.energy - drain * dt
+    energy = np.where(charge > 0, np.minimum(state.energy_max, drained + charge * dt), drained)
+    received = energy - drained
+    state.energy[:] = energy
+    state.touch("energy", slice(None))
+    state.used_energy += drain * dt
+
+    if net.active:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = np.where(charge > 0, received / charge, 0.0)
+        for mc, p in zip(net.mc_list, mc_rate):
+            if not mc.is_active:
+                continue
+            if not mc.is_stand:
+                time_move = distance.euclidean(mc.start, mc.end) / mc.velocity
+                if time_move > 0:
+                    mc.current = (mc.current[0] + (mc.end[0] - mc.start[0]) / time_move * dt,
+                                  mc.current[1] + (mc.end[1] - mc.start[1]) / time_move * dt)
+                mc.energy -= mc.e_move * dt
+            elif p is not None:
+                mc.energy -= float(np.sum(p * share))
+            else:
+                mc.energy = min(mc.energy + mc.e_self_charge * dt, mc.capacity)
+    return t + dt
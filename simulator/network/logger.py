@@ -0,0 +1,160 @@
+import csv
+import glob
+import os
+import queue
+import threading
+import numpy as np
+
+NET_LOG_FIELDS = ['time_stamp', 'number_of_dead_nodes', 'number_of_monitored_target', 'lowest_node_energy',
+                  'lowest_node_location', 'avg_energy']  # followed by the columns of get_net_log_fields
+MC_LOG_FIELDS = ['time_stamp', 'id', 'starting_point', 'destination_point', 'decision_id', 'charging_time',
+                 'moving_time']
+
+
+def get_net_log_fields(mc_id, profile=False):
+    """
+    :param mc_id: ids of the mcs
+    :param profile: add the "profile" column, the summary of the profiler at every row
+    :return: columns of the network log, NET_LOG_FIELDS then a status and a location column for every mc
+    """
+    fields = NET_LOG_FIELDS + ['MC_{}_status'.format(i) for i in mc_id] + ['MC_{}_location'.format(i) for i in mc_id]
+    return fields + ['profile'] if profile else fields
+
+
+def get_columnar_file(file_name):
+    return os.path.splitext(file_name)[0] + ".npz"
+
+
+def get_chunk_file(file_name, index):
+    return os.path.splitext(file_name)[0] + ".part{:06d}.npz".format(index)
+
+
+def list_chunk(file_name):
+    """
+    :return: chunk files of the columnar copy of a log, written by LogWriter.flush, oldest first
+    """
+    return sorted(glob.glob(os.path.splitext(glob.escape(file_name))[0] + ".part[0-9]*.npz"))
+
+
+def load_log(file_name):
+    """
+    :param file_name: csv log file, its columnar copy is read, with the chunks not merged into it yet
+    :return: dictionary field -> array, locations are arrays of shape (number of rows, 2)
+    """
+    part = [get_columnar_file(file_name)] if os.path.exists(get_columnar_file(file_name)) else []
+    part += list_chunk(file_name)
+    if not part:
+        raise FileNotFoundError("no columnar log for {}".format(file_name))
+    columns = {}
+    for part_file in part:
+        with np.load(part_file, allow_pickle=False) as data:
+            for field in data.files:
+                columns.setdefault(field, []).append(data[field])
+    return {field: np.concatenate(value) for field, value in columns.items()}
+
+
+def save_columnar(file_name, columns):
+    with open(file_name + ".tmp", "wb") as f:
+        np.savez(f, **{field: np.asarray(value) for field, value in columns.items()})
+    os.replace(file_name + ".tmp", file_name)
+
+
+class LogWriter:
+    def __init__(self, file_name, fieldnames, mode="w", columnar=False, queue_size=10000, batch_size=1000):
+        """
+        csv log kept open and written in batches by a background thread
+        :param file_name: csv file
+        :param fieldnames: columns of the log
+        :param mode: "w" starts a new log with its header, "a" appends to an existing one
+        :param columnar: also keep the log as arrays in a .npz file next to the csv file, every flush adds the new
+        rows as a chunk file and close merges the chunks into it
+        :param queue_size: rows waiting to be written, write blocks when the queue is full
+        :param batch_size: maximum number of rows written at once
+        """
+        self.file_name = file_name
+        self.fieldnames = fieldnames
+        self.columnar = columnar
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.columns = {field: [] for field in fieldnames}  # rows written since the last chunk
+        self.nb_chunk = 0
+        if columnar and mode == "a":
+            self.nb_chunk = len(list_chunk(file_name))
+        elif columnar:
+            for part_file in [get_columnar_file(file_name)] + list_chunk(file_name):
+                if os.path.exists(part_file):
+                    os.remove(part_file)
+        self.file = open(file_name, mode, newline="", buffering=1 << 16)
+        self.writer = csv.DictWriter(self.file, fieldnames=fieldnames)
+        if mode == "w":
+            self.writer.writeheader()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None  # exception of the background thread
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            rows = [self.queue.get()]
+            while rows[-1] is not None and len(rows) < self.batch_size:
+                try:
+                    rows.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = rows[-1] is None
+            if stop:
+                rows.pop()
+            try:
+                if self.error is None:
+                    self.writer.writerows(rows)
+                    if self.columnar:
+                        for row in rows:
+                            for field in self.fieldnames:
+                                self.columns[field].append(row.get(field))
+            except Exception as error:
+                # raised again in the simulation by write, flush or close, the rows queued after it are dropped
+                self.error = error
+            finally:
+                for _ in range(len(rows) + stop):
+                    self.queue.task_done()
+            if stop:
+                return
+
+    def check_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def write(self, row):
+        self.check_error()
+        self.queue.put(row)
+
+    def flush(self):
+        """
+        wait until every queued row is written, then flush the csv file and write the new rows as a columnar chunk
+        :return: None
+        """
+        self.queue.join()
+        self.check_error()
+        self.file.flush()
+        if self.columnar and self.columns[self.fieldnames[0]]:
+            save_columnar(get_chunk_file(self.file_name, self.nb_chunk), self.columns)
+            self.nb_chunk += 1
+            self.columns = {field: [] for field in self.fieldnames}
+
+    def close(self):
+        """
+        write the remaining rows, then merge the columnar chunks into the .npz file
+        :return: None
+        """
+        if self.file is None or self.file.closed:
+            return
+        try:
+            self.flush()
+            if self.columnar and list_chunk(self.file_name):
+                save_columnar(get_columnar_file(self.file_name), load_log(self.file_name))
+                for chunk_file in list_chunk(self.file_name):
+                    os.remove(chunk_file)
+        finally:
+            self.queue.put(None)
+            self.thread.join()
+            self.file.close()
@@ -1,125 +1,270 @@
+import copy
 import csv
+import random
+from collections import deque
+import numpy as np
 from scipy.spatial import distance
 
 from simulator.network import parameter as para
-from simulator.network.utils import uniform_com_func, to_string, count_package_function, set_checkpoint
+from simulator.network.checkpoint import set_checkpoint
+from simulator.network.event import skip_to_next_event
+from simulator.mobilecharger.fleet import MCFleet
+from simulator.network.logger import LogWriter, MC_LOG_FIELDS, get_net_log_fields
+from simulator.network.plotter import Plotter
+from simulator.network.profiler import Profiler
+from simulator.network.routing import RoutingTable
+from simulator.network.spatial import SpatialIndex
+from simulator.network.utils import uniform_com_func, expected_com_func, to_string, count_package_function, \
+    get_charge_radius
+from simulator.node.state import NodeState
 
 
 class Network:
-    def __init__(self, list_node=None, mc_list=None, target=None, package_size=400, experiment=None):
+    def __init__(self, list_node=None, mc_list=None, target=None, package_size=400, experiment=None,
+                 com_func=uniform_com_func, trace=False, debug=False, columnar_log=False, profile=False,
+                 neighbor=None, plot=None):
         self.node = list_node
-        self.set_neighbor()
+        self.node_state = NodeState(list_node)
+        self.spatial_index = SpatialIndex(self.node_state.location)
+        self.set_neighbor(neighbor)
         self.set_level()
         self.mc_list = mc_list
+        self.mc_fleet = MCFleet(mc_list)
         self.target = target
+        self.target_mask = np.zeros(len(list_node), dtype=bool)
+        self.target_mask[target] = True
+        self.routing = RoutingTable(self.node, self.node_state, target)
         self.charging_pos = []
+        self.pos_node_distance = None  # distance from every charging position to every sensor
+        self.pos_charge_rate = None  # charge rate of every sensor from every charging position
+        self.pos_distance = None  # distance between charging positions
+        self.travel_time = {}  # velocity -> travel time between charging positions
+        self.pos_in_range = None  # ids of the sensors charged from every charging position
         self.package_size = package_size
+        self.com_func = com_func  # uniform_com_func sends package by package, batch_com_func all at once
+        self.trace = trace  # keep the path of the packages sent by batch_com_func
+        self.packages = []
+        self.debug = debug  # cross-check the incrementally maintained values against full recomputation
 
         self.active = False
         self.package_lost = False
 
+        self.columnar_log = columnar_log  # also write the logs as .npz arrays, see logger.load_log
+        self.net_log = None  # LogWriter, open while simulating
+        self.mc_log = None
+        self.profiler = Profiler(enabled=profile)  # wall time per phase, summed up in the network log when enabled
+        # figures captured during the run, see plotter.py, the plot_mode of parameter.py if plot is None
+        self.plotter = Plotter(mode=para.plot_mode if plot is None else plot)
+        self.set_experiment(experiment)
+
+    def set_experiment(self, experiment):
+        """
+        :param experiment: name of the run, "<type>_<index>_<run>", its logs, checkpoints and figures are named after it
+        """
         self.experiment = experiment
         self.net_log_file = "log/net_log_" + self.experiment + ".csv"
         self.mc_log_file = "log/mc_log_" + self.experiment + ".csv"
+        self.static_saved = False  # static part of the checkpoints written for this run
+        self.plotter.prefix = self.experiment
 
-
-    def set_neighbor(self):
-        for node in self.node:
-            for other in self.node:
-                if other.id != node.id and distance.euclidean(node.location, other.location) <= node.com_ran:
-                    node.neighbor.append(other.id)
+    def set_neighbor(self, list_neighbor=None):
+        """
+        :param list_neighbor: neighbors of every sensor if they are already known, e.g. read from a checkpoint
+        """
+        if list_neighbor is None:
+            list_neighbor = self.spatial_index.query_neighbor([node.com_ran for node in self.node])
+        for node, neighbor in zip(self.node, list_neighbor):
+            node.neighbor.extend(neighbor)
 
     def set_level(self):
-        queue = []
-        for node in self.node:
+        queue = deque()
+        level = self.node_state.level
+        max_ran = max(node.com_ran for node in self.node)
+        for node_id in self.spatial_index.query_radius(para.base, max_ran):
+            node = self.node[node_id]
             if distance.euclidean(node.location, para.base) < node.com_ran:
-                node.level = 1
-                queue.append(node.id)
+                level[node_id] = 1
+                queue.append(node_id)
         while queue:
-            for neighbor_id in self.node[queue[0]].neighbor:
-                if not self.node[neighbor_id].level:
-                    self.node[neighbor_id].level = self.node[queue[0]].level + 1
+            node_id = queue.popleft()
+            for neighbor_id in self.node[node_id].neighbor:
+                if not level[neighbor_id]:
+                    level[neighbor_id] = level[node_id] + 1
                     queue.append(neighbor_id)
-            queue.pop(0)
 
 
 
-    def communicate(self, func=uniform_com_func):
+    def set_charging_pos(self, charging_pos):
+        """
+        fix the charging positions and precompute their distances and charge rates
+        :param charging_pos: list of charging positions
+        :return: None
+        """
+        self.charging_pos = charging_pos
+        position = np.asarray(charging_pos, dtype=float).reshape(-1, 2)
+        self.pos_node_distance = np.linalg.norm(position[:, None, :] - self.node_state.location[None, :, :], axis=2)
+        self.pos_charge_rate = para.alpha / (self.pos_node_distance + para.beta) ** 2
+        self.pos_distance = np.linalg.norm(position[:, None, :] - position[None, :, :], axis=2)
+        self.travel_time = {}
+        radius = get_charge_radius()
+        self.pos_in_range = [self.spatial_index.query_radius(pos, radius) for pos in position]
+
+    def get_travel_time(self, velocity):
+        """
+        :param velocity: velocity of the mc
+        :return: matrix of travel times between charging positions
+        """
+        if velocity not in self.travel_time:
+            self.travel_time[velocity] = self.pos_distance / velocity
+        return self.travel_time[velocity]
+
+    def get_pos_id(self, location, pos_id):
+        """
+        :return: pos_id if location is the charging position pos_id, else -1
+        """
+        if 0 <= pos_id < len(self.charging_pos) and tuple(location) == tuple(self.charging_pos[pos_id]):
+            return pos_id
+        return -1
+
+    def get_charge_rate(self, location, pos_id=-1):
+        """
+        :param location: location of the charger
+        :param pos_id: charging position the charger is expected to stand on
+        :return: charge rate of every sensor, read from the precomputed matrix when location is that position
+        """
+        if self.pos_charge_rate is not None and self.get_pos_id(location, pos_id) != -1:
+            return self.pos_charge_rate[pos_id]
+        d = np.linalg.norm(self.node_state.location - np.asarray(location, dtype=float), axis=1)
+        return para.alpha / (d + para.beta) ** 2
+
+    def get_charge_range(self, location, pos_id=-1):
+        """
+        :param location: location of the charger
+        :param pos_id: charging position the charger is expected to stand on
+        :return: ids of the sensors the charger reaches, precomputed when location is that position
+        """
+        if self.pos_in_range is not None and self.get_pos_id(location, pos_id) != -1:
+            return self.pos_in_range[pos_id]
+        return self.spatial_index.query_radius(location, get_charge_radius())
+
+    def charge_sensors(self, mc):
+        """
+        give the sensors in range of a charging mc the energy it sends in this second, in its own turn so that the
+        mcs after it see the charged sensors
+        :param mc: mobile charger standing at its charging position
+        :return: None
+        """
+        state = self.node_state
+        in_range = self.get_charge_range(mc.current, mc.state)
+        energy = state.energy[in_range]
+        energy_max = state.energy_max[in_range]
+        p = self.get_charge_rate(mc.current, mc.state)[in_range]
+        p = np.where(state.is_active[in_range] & (energy <= energy_max - 10 ** -5), np.minimum(energy_max - energy, p), 0.0)
+        state.energy[in_range] = energy + p
+        state.touch("energy", in_range)
+        # one sum instead of Node.charge subtracting sensor by sensor: the mc energy can differ in the last bits
+        mc.energy -= float(p.sum())
+
+    def communicate(self, func=None):
+        if func is None:
+            func = self.com_func
         return func(self)
 
-    def run_per_second(self, t, optimizer):
-        state = self.communicate()
-        request_id = []
-        for index, node in enumerate(self.node):
-            if node.energy < node.energy_thresh:
-                node.request(optimizer=optimizer, t=t)
-                request_id.append(index)
-            else:
-                node.is_request = False
-        if request_id:
-            for index, node in enumerate(self.node):
-                if index not in request_id and (t - node.check_point[-1]["time"]) > 50:
-                    node.set_check_point(t)
+    def run_per_second(self, t, optimizer, com_func=None):
+        with self.profiler.phase("communicate"):
+            state = self.communicate(com_func)
+        with self.profiler.phase("request"):
+            is_below = self.node_state.energy < self.node_state.energy_thresh
+            request_id = np.flatnonzero(is_below)
+            for index in request_id:
+                self.node[index].request(optimizer=optimizer, t=t)
+            self.node_state.is_request[~is_below] = False
+            if request_id.size:
+                row = np.flatnonzero(~is_below)
+                self.node_state.set_check_point(row[t - self.node_state.get_last_check_point_time(row) > 50], t)
             
         if optimizer and self.active:
-            for mc in self.mc_list:
-                # if mc.id*300 < t:
-                #     mc.run(network=self, time_stem=t, net=self, optimizer=optimizer)
-                mc.run(network=self, time_stem=t, net=self, optimizer=optimizer)
+            with self.profiler.phase("mc_run"):
+                self.mc_fleet.run(self, t, optimizer)
         return state
 
-    def simulate_max_time(self, optimizer=None, t=0, dead_time=0, max_time=2000000):
+    def simulate_max_time(self, optimizer=None, t=0, dead_time=0, max_time=2000000, engine="tick"):
+        """
+        :param engine: "tick" simulates every second, "event" jumps from event to event with expected traffic
+        """
         nb_dead = self.count_dead_node()
         nb_package = self.count_package()
         dead_time = dead_time
 
-        if t == 0:
-            with open(self.net_log_file, "w") as information_log:
-                writer = csv.DictWriter(information_log, fieldnames=['time_stamp', 'number_of_dead_nodes', 'number_of_monitored_target', 'lowest_node_energy', 'lowest_node_location', 'avg_energy', 'MC_0_status', 'MC_1_status', 'MC_2_status', 'MC_0_location', 'MC_1_location', 'MC_2_location'])
-                writer.writeheader()
-            
-            with open(self.mc_log_file, "w") as mc_log:
-                writer = csv.DictWriter(mc_log, fieldnames=['time_stamp', 'id', 'starting_point', 'destination_point', 'decision_id', 'charging_time', 'moving_time'])
-                writer.writeheader()
-        
-        t = t
+        mode = "w" if t == 0 else "a"
+        self.net_log = LogWriter(self.net_log_file, get_net_log_fields([mc.id for mc in self.mc_list], self.profiler.enabled), mode=mode, columnar=self.columnar_log)
+        self.mc_log = LogWriter(self.mc_log_file, MC_LOG_FIELDS, mode=mode, columnar=self.columnar_log)
+        try:
+            dead_time = self.run_until_dead(optimizer, t, dead_time, nb_package, max_time, engine)
+        finally:
+            self.net_log.close()
+            self.mc_log.close()
+            self.net_log = self.mc_log = None
+            self.plotter.render()
+
+        print('\n[Network]: Finished with {} dead sensors, {} packages at {}s!'.format(self.count_dead_node(), self.count_package(), dead_time))
+        if self.profiler.enabled:
+            self.profiler.report()
+        return dead_time, nb_dead
+
+    def get_network_info(self, t):
+        """
+        :return: row of the network log at time t, see logger.get_net_log_fields
+        """
+        network_info = {
+            'time_stamp' : t,
+            'number_of_dead_nodes' : self.count_dead_node(),
+            'number_of_monitored_target' : self.count_package(),
+            'lowest_node_energy': round(self.node[self.find_min_node()].energy, 3),
+            'lowest_node_location': self.node[self.find_min_node()].location,
+            'avg_energy': self.get_average_energy(),
+        }
+        for mc in self.mc_list:
+            network_info['MC_{}_status'.format(mc.id)] = mc.get_status()
+        for mc in self.mc_list:
+            network_info['MC_{}_location'.format(mc.id)] = mc.current
+        if self.profiler.enabled:
+            network_info['profile'] = self.profiler.get_summary()
+        return network_info
+
+    def run_until_dead(self, optimizer, t, dead_time, nb_package, max_time, engine):
+        """
+        main loop of simulate_max_time, runs until a target is lost or max_time is reached
+        :return: time at which the first target was lost
+        """
+        nb_dead = self.count_dead_node()
         while t <= max_time and nb_package==len(self.target):
+            if engine == "event":
+                with self.profiler.phase("event_skip"):
+                    t = skip_to_next_event(self, optimizer, t, max_time)
             t = t + 1
             if (t - 1) % 100 == 0:
-                print("[Network] Simulating time: {}s, lowest energy node: {:.4f} at {}".format(t, self.node[self.find_min_node()].energy, self.node[self.find_min_node()].location))
-                print('\t\tNumber of dead nodes: {}'.format(self.count_dead_node()))
-                print('\t\tNumber of packages: {}'.format(self.count_package()))
+                with self.profiler.phase("log"):
+                    print("[Network] Simulating time: {}s, lowest energy node: {:.4f} at {}".format(t, self.node[self.find_min_node()].energy, self.node[self.find_min_node()].location))
+                    print('\t\tNumber of dead nodes: {}'.format(self.count_dead_node()))
+                    print('\t\tNumber of packages: {}'.format(self.count_package()))
                 
-                network_info = {
-                    'time_stamp' : t,
-                    'number_of_dead_nodes' : self.count_dead_node(),
-                    'number_of_monitored_target' : self.count_package(),
-                    'lowest_node_energy': round(self.node[self.find_min_node()].energy, 3),
-                    'lowest_node_location': self.node[self.find_min_node()].location,     
-                    'avg_energy': self.get_average_energy(),
-                    'MC_0_status' : self.mc_list[0].get_status(),
-                    'MC_1_status' : self.mc_list[1].get_status(),
-                    'MC_2_status' : self.mc_list[2].get_status(),
-                    'MC_0_location' : self.mc_list[0].current,
-                    'MC_1_location' : self.mc_list[1].current,
-                    'MC_2_location' : self.mc_list[2].current,
-                }
-                with open(self.net_log_file, 'a') as information_log:
-                    node_writer = csv.DictWriter(information_log, fieldnames=['time_stamp', 'number_of_dead_nodes', 'number_of_monitored_target', 'lowest_node_energy', 'lowest_node_location', 'avg_energy', 'MC_0_status', 'MC_1_status', 'MC_2_status', 'MC_0_location', 'MC_1_location', 'MC_2_location'])
-                    node_writer.writerow(network_info)
-                for mc in self.mc_list:
-                    print("\t\tMC #{} is {} at {}".format(mc.id, mc.get_status(), mc.current))
-
-            if (t-1) % 500 == 0 and t > 1:
-                set_checkpoint(t=t, network=self, optimizer=optimizer, dead_time=dead_time)
+                    self.net_log.write(self.get_network_info(t))
+                    for mc in self.mc_list:
+                        print("\t\tMC #{} is {} at {}".format(mc.id, mc.get_status(), mc.current))
 
             ######################################
             if t == 200:
-                optimizer.net_partition(net=self)
+                with self.profiler.phase("partition"):
+                    optimizer.net_partition(net=self, t=t)
                 self.active = True
+            elif self.active and (t - 1) % 100 == 0 and optimizer.need_partition(self, t):
+                # tested on the log ticks, which the event engine never skips
+                with self.profiler.phase("partition"):
+                    optimizer.net_repartition(net=self, t=t)
             ######################################
 
-            state = self.run_per_second(t, optimizer)
+            state = self.run_per_second(t, optimizer, com_func=expected_com_func if engine == "event" else None)
             current_dead = self.count_dead_node()
             current_package = self.count_package()
             if not self.package_lost:
@@ -127,61 +272,70 @@ class Network:
                     self.package_lost = True
                     dead_time = t
             if current_dead != nb_dead or current_package != nb_package:
-                network_info = {
-                    'time_stamp' : t,
-                    'number_of_dead_nodes' : self.count_dead_node(),
-                    'number_of_monitored_target' : self.count_package(),
-                    'lowest_node_energy': round(self.node[self.find_min_node()].energy, 3),
-                    'lowest_node_location': self.node[self.find_min_node()].location,
-                    'avg_energy': self.get_average_energy(),
-                    'MC_0_status' : self.mc_list[0].get_status(),
-                    'MC_1_status' : self.mc_list[1].get_status(),
-                    'MC_2_status' : self.mc_list[2].get_status(),
-                    'MC_0_location' : self.mc_list[0].current,
-                    'MC_1_location' : self.mc_list[1].current,
-                    'MC_2_location' : self.mc_list[2].current,
-                }
-                with open(self.net_log_file, 'a') as information_log:
-                    node_writer = csv.DictWriter(information_log, fieldnames=['time_stamp', 'number_of_dead_nodes', 'number_of_monitored_target', 'lowest_node_energy', 'lowest_node_location', 'MC_0_status', 'MC_1_status', 'MC_2_status', 'MC_0_location', 'MC_1_location', 'MC_2_location'])
-                    node_writer.writerow(network_info)
+                self.net_log.write(self.get_network_info(t))
                 break
 
+            if t % para.checkpoint_period == 0:
+                # state at the end of second t, a resumed run continues with second t + 1
+                with self.profiler.phase("checkpoint"):
+                    set_checkpoint(t=t, network=self, optimizer=optimizer, dead_time=dead_time)
+        return dead_time
 
-        print('\n[Network]: Finished with {} dead sensors, {} packages at {}s!'.format(self.count_dead_node(), self.count_package(), dead_time))
-        return dead_time, nb_dead
+    def simulate(self, optimizer=None, t=0, dead_time=0, max_time=2000000, engine="tick"):
+        """
+        :param engine: "tick", "event", or "validate" to run both engines from the current state and compare them
+        """
+        if engine == "validate":
+            return self.validate_event_engine(optimizer=optimizer, t=t, dead_time=dead_time, max_time=max_time)
+        life_time = self.simulate_max_time(optimizer=optimizer, t=t, dead_time=dead_time, max_time=max_time,
+                                           engine=engine)
+        return life_time
 
-    def simulate(self, optimizer=None, t=0, dead_time=0, max_time=2000000):
+    def validate_event_engine(self, optimizer=None, t=0, dead_time=0, max_time=2000000):
+        event_net, event_optimizer = copy.deepcopy((self, optimizer))
+        # a run of its own, so that it neither overwrites nor removes the files of the tick run
+        event_net.set_experiment(self.experiment + "_event")
+        random_state = random.getstate()
+        event_life_time = event_net.simulate_max_time(optimizer=event_optimizer, t=t, dead_time=dead_time,
+                                                      max_time=max_time, engine="event")
+        random.setstate(random_state)
         life_time = self.simulate_max_time(optimizer=optimizer, t=t, dead_time=dead_time, max_time=max_time)
+        error = abs(event_life_time[0] - life_time[0]) / life_time[0] if life_time[0] else 0.0
+        print('[Network] Validation: tick engine {}, event engine {}, relative error {:.2%}'.format(
+            life_time, event_life_time, error))
         return life_time
 
     def print_net(self, func=to_string):
         func(self)
 
     def find_min_node(self):
-        min_energy = 10 ** 10
-        min_id = -1
-        for node in self.node:
-            if node.energy < min_energy:
-                min_energy = node.energy
-                min_id = node.id
-        return min_id
+        if not len(self.node):
+            return -1
+        row = self.node_state.get_min_row()
+        if self.debug:
+            assert row == int(np.argmin(self.node_state.energy))
+        return self.node[row].id
 
     def count_dead_node(self):
-        count = 0
-        for node in self.node:
-            if node.energy <= 0:
-                count += 1
-        return count
+        nb_dead = self.node_state.get_nb_dead()
+        if self.debug:
+            assert nb_dead == int(np.count_nonzero(self.node_state.energy <= 0))
+        return nb_dead
 
-    def count_package(self, count_func=count_package_function):
-        count = count_func(self)
+    def count_package(self, count_func=None):
+        if count_func is not None:
+            return count_func(self)
+        count = self.routing.get_nb_monitored()
+        if self.debug:
+            probe = count_package_function(self)
+            assert count == probe, "monitored targets: tracked {}, probed {}".format(count, probe)
         return count
 
     def get_average_energy(self):
-        total = 0
-        for node in self.node:
-            total += node.avg_energy
-        return total/len(self.node)
+        avg_energy = self.node_state.get_mean_avg_energy()
+        if self.debug:
+            assert avg_energy == float(np.mean(self.node_state.avg_energy))
+        return avg_energy
 
     ##############################################################################################
     def simulate_lifetime(self, optimizer, file_name="log/energy_log.csv"):
@@ -1,5 +1,7 @@
 alpha = 36.0
 beta = 30.0
+charge_ran = 10 ** 9
+charge_eps = 0.0  # charge rates below this value are neglected
 base = (500.0, 500.0)
 depot = (0.0, 0.0)
 b = 500.0
@@ -10,3 +12,7 @@ EFS = 0.00000000001
 EMP = 0.0000000000000013
 prob = 1.0
 E_mc_thresh = 10
+checkpoint_period = 500  # a checkpoint is set at the end of every second t with t % checkpoint_period == 0
+checkpoint_keep = 3  # number of checkpoints kept for each run
+recluster_keep = 5.0  # charging positions moving less than this on a re-partition keep their q-table rows
+plot_mode = "deferred"  # "off", "deferred" or "background", see plotter.py
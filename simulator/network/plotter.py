@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+import numpy as np
+
+PLOT_MODES = ['off', 'deferred', 'background']
+
+
+def render_plot(name, data, file_name):
+    """
+    draw one captured figure on a figure of its own, matplotlib is only imported here
+    :param name: "node_distribution" or "network_plot"
+    :param data: arrays captured by Plotter.add
+    :param file_name: png file written
+    :return: None
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    ax = fig.subplots()
+    if name == "node_distribution":
+        ax.hist(data["avg_energy"], bins=100)
+    elif name == "network_plot":
+        size = data["avg_energy"]
+        norm = np.linalg.norm(size)
+        ax.scatter(data["location"][:, 0], data["location"][:, 1], s=size / norm * 80 if norm else size)
+        ax.scatter(data["charging_pos"][:, 0], data["charging_pos"][:, 1], c='red', marker='^')
+    else:
+        raise ValueError("unknown plot {}".format(name))
+    os.makedirs(os.path.dirname(file_name) or '.', exist_ok=True)
+    fig.savefig(file_name)
+
+
+def render_all(pending):
+    for name, data, file_name in pending:
+        render_plot(name, data, file_name)
+
+
+class Plotter:
+    def __init__(self, mode="deferred", prefix="", fig_dir="fig"):
+        """
+        figures of a simulation, captured as arrays so that drawing them stays out of the simulation loop
+        :param mode: "off" drops them, "deferred" draws them in render once the run is over, "background" draws
+        them in a separate process as soon as they are captured
+        :param prefix: appended to the file names, e.g. the experiment name
+        :param fig_dir: folder of the png files
+        """
+        if mode not in PLOT_MODES:
+            raise ValueError("unknown plot mode {}".format(mode))
+        self.mode = mode
+        self.prefix = prefix
+        self.fig_dir = fig_dir
+        self.pending = []  # (name, data, file name) waiting for render
+        self.process = []  # background processes drawing
+
+    def add(self, name, **data):
+        """
+        :param name: kind of figure, see render_plot
+        :param data: arrays of the figure, copied so that the simulation can keep changing them
+        """
+        if self.mode == "off":
+            return
+        data = {key: np.array(value) for key, value in data.items()}
+        file_name = os.path.join(self.fig_dir, "{}_{}.png".format(name, self.prefix) if self.prefix else name + ".png")
+        if self.mode == "deferred":
+            self.pending.append((name, data, file_name))
+        else:
+            # spawn rather than fork: the parent runs logging threads
+            process = multiprocessing.get_context("spawn").Process(target=render_all, args=([(name, data, file_name)],))
+            process.start()
+            self.process.append(process)
+
+    def render(self):
+        """
+        draw the deferred figures and wait for the background ones
+        """
+        render_all(self.pending)
+        self.pending = []
+        for process in self.process:
+            process.join()
+        self.process = []
@@ -0,0 +1,75 @@
+import time
+from tabulate import tabulate
+
+
+class NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_PHASE = NullPhase()  # returned by a disabled profiler, entering it costs nothing
+
+
+class Phase:
+    __slots__ = ['profiler', 'name', 'start']
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+    def __init__(self, enabled=False):
+        """
+        wall time and number of calls of the phases of a simulation
+        :param enabled: when False, phase returns a shared no-op context and nothing is measured
+        """
+        self.enabled = enabled
+        self.total_time = {}  # phase -> accumulated wall time in seconds
+        self.calls = {}  # phase -> number of calls
+
+    def phase(self, name):
+        """
+        :param name: name of the phase, sub-steps are named "phase.sub_step" and are included in their phase
+        :return: context manager measuring the code it wraps
+        """
+        if not self.enabled:
+            return NULL_PHASE
+        return Phase(self, name)
+
+    def add(self, name, elapsed):
+        self.total_time[name] = self.total_time.get(name, 0.0) + elapsed
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def get_rows(self):
+        """
+        :return: one row per phase, by decreasing total time
+        """
+        rows = []
+        for name in sorted(self.total_time, key=self.total_time.get, reverse=True):
+            rows.append({'phase': name, 'calls': self.calls[name],
+                         'total_time': self.total_time[name], 'mean_time': self.total_time[name] / self.calls[name]})
+        return rows
+
+    def get_summary(self):
+        """
+        :return: phase -> (calls, total time) accumulated so far, written as a string like the locations of the logs
+        """
+        return str({row['phase']: (row['calls'], round(row['total_time'], 6)) for row in self.get_rows()})
+
+    def report(self):
+        print("[Profiler] Time per phase (sub-steps are included in their phase):")
+        print(tabulate([[row['phase'], row['calls'], row['total_time'], row['mean_time']] for row in self.get_rows()],
+                       headers=['Phase', 'Calls', 'Total (s)', 'Mean (s)']), '\n')
@@ -0,0 +1,129 @@
+import heapq
+import math
+import numpy as np
+
+from simulator.network import parameter as para
+
+
+def send_energy(d):
+    """
+    energy to transmit one bit over a link
+    :param d: length of the link, scalar or array
+    :return: free space model below the crossover distance, multipath model above it
+    """
+    d0 = math.sqrt(para.EFS / para.EMP)
+    return np.where(d <= d0, para.ET + para.EFS * d ** 2, para.ET + para.EMP * d ** 4)
+
+
+class RoutingTable:
+    def __init__(self, list_node, state, target=()):
+        """
+        next hop of every sensor towards the base, kept up to date when sensors die
+        :param list_node: list of sensors with neighbors and levels already set
+        :param state: NodeState shared with the network
+        :param target: ids of the targets whose coverage is tracked
+        """
+        self.state = state
+        self.distance_to_base = np.linalg.norm(state.location - np.asarray(para.base, dtype=float), axis=1)
+        com_ran = np.asarray([node.com_ran for node in list_node], dtype=float)
+        self.in_base_range = self.distance_to_base <= com_ran  # sensors sending directly to the base
+        self.neighbor = [np.asarray(node.neighbor, dtype=int) for node in list_node]
+        self.reverse_neighbor = [[] for _ in list_node]  # sensors having this sensor as neighbor
+        for node in list_node:
+            for neighbor_id in node.neighbor:
+                self.reverse_neighbor[neighbor_id].append(node.id)
+        self.next_hop = np.full(len(list_node), -1, dtype=int)
+        self.send_cost = send_energy(self.distance_to_base)  # energy per bit to reach the next hop
+        self.dirty = set()
+        self.reachable = np.zeros(len(list_node), dtype=bool)  # sensors whose packages reach the base
+        self.target_count = np.bincount(np.asarray(target, dtype=int), minlength=len(list_node))
+        self.nb_monitored = 0  # number of targets whose packages reach the base
+        self.update_rows(range(len(list_node)))
+        self.propagate(range(len(list_node)))
+
+    def update_rows(self, rows):
+        """
+        recompute the next hop of some sensors
+        :param rows: ids of the sensors
+        :return: ids of the sensors whose next hop changed
+        """
+        level = self.state.level
+        is_active = self.state.is_active
+        changed = []
+        for row in rows:
+            next_hop = self.next_hop[row]
+            self._update_row(row, level, is_active)
+            if self.next_hop[row] != next_hop:
+                changed.append(row)
+        return changed
+
+    def _update_row(self, row, level, is_active):
+        if not is_active[row]:
+            self.next_hop[row] = -1
+        else:
+            neighbor = self.neighbor[row]
+            candidate = neighbor[(level[neighbor] < level[row]) & is_active[neighbor]]
+            if candidate.size:
+                receiver_id = candidate[np.argmin(self.distance_to_base[candidate])]
+                self.next_hop[row] = receiver_id
+                if not self.in_base_range[row]:
+                    d = np.linalg.norm(self.state.location[row] - self.state.location[receiver_id])
+                    self.send_cost[row] = send_energy(d)
+            else:
+                self.next_hop[row] = -1
+
+    def propagate(self, rows):
+        """
+        update which sensors reach the base after the next hop of some sensors changed
+        :param rows: ids of the sensors whose next hop changed
+        :return: None, only the subtrees below these sensors are visited
+        """
+        level = self.state.level
+        heap = [(level[row], row) for row in rows]
+        heapq.heapify(heap)
+        while heap:
+            _, row = heapq.heappop(heap)
+            next_hop = self.next_hop[row]
+            reachable = bool(self.in_base_range[row] or (next_hop != -1 and self.reachable[next_hop]))
+            if reachable != self.reachable[row]:
+                self.reachable[row] = reachable
+                self.nb_monitored += int(self.target_count[row]) if reachable else -int(self.target_count[row])
+                for child in self.reverse_neighbor[row]:
+                    if self.next_hop[child] == row:
+                        heapq.heappush(heap, (level[child], child))
+
+    def invalidate(self, node_id):
+        """
+        mark the entries depending on a sensor whose state flipped
+        :param node_id: id of the sensor
+        :return: None
+        """
+        self.dirty.add(node_id)
+        self.dirty.update(self.reverse_neighbor[node_id])
+
+    def refresh(self):
+        """
+        recompute the entries marked by invalidate
+        :return: None
+        """
+        if self.dirty:
+            dirty = self.dirty
+            self.dirty = set()
+            self.propagate(self.update_rows(dirty))
+
+    def get_next_hop(self, node_id):
+        """
+        :param node_id: id of the sensor
+        :return: id of the next hop towards the base, -1 if there is none
+        """
+        if self.dirty:
+            self.refresh()
+        return int(self.next_hop[node_id])
+
+    def get_nb_monitored(self):
+        """
+        :return: number of targets whose packages reach the base
+        """
+        if self.dirty:
+            self.refresh()
+        return self.nb_monitored
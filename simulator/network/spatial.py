@@ -0,0 +1,40 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class SpatialIndex:
+    def __init__(self, location):
+        """
+        KD-tree over the locations of the sensors, built once per network
+        :param location: array of shape (number of sensors, 2), row i is the location of sensor i
+        """
+        self.location = np.asarray(location, dtype=float).reshape(-1, 2)
+        self.tree = cKDTree(self.location)
+
+    def query_neighbor(self, com_ran):
+        """
+        find the neighbors of every sensor
+        :param com_ran: communication range of every sensor
+        :return: list of sorted ids within the range of each sensor, the sensor itself excluded
+        """
+        com_ran = np.broadcast_to(np.asarray(com_ran, dtype=float), (len(self.location),))
+        list_neighbor = []
+        for node_id, neighbor in enumerate(self.tree.query_ball_point(self.location, com_ran)):
+            list_neighbor.append(sorted(other_id for other_id in neighbor if other_id != node_id))
+        return list_neighbor
+
+    def query_radius(self, point, r):
+        """
+        :param point: center of the disk
+        :param r: radius of the disk
+        :return: sorted ids of the sensors whose distance to point is at most r
+        """
+        return np.asarray(sorted(self.tree.query_ball_point(point, r)), dtype=int)
+
+    def query_nearest(self, point):
+        """
+        :param point: location
+        :return: id of the sensor nearest to point
+        """
+        _, node_id = self.tree.query(point)
+        return int(node_id)
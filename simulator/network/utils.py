@@ -1,18 +1,121 @@
 import random
-import pickle
+import numpy as np
 
+from simulator.network import parameter as para
 from simulator.network.package import Package
 
+COM_FUNCS = ['uniform_com_func', 'batch_com_func']  # traffic models selectable with --com-func
 
 def uniform_com_func(net):
-    for node in net.node:
-        if node.id in net.target and random.random() <= node.prob and node.is_active:
+    for node_id in np.flatnonzero(net.target_mask):
+        node = net.node[node_id]
+        if random.random() <= node.prob and node.is_active:
             package = Package(package_size=net.package_size)
             node.send(net, package)
             # print(package.path)
     return True
 
 
+def get_charge_radius():
+    """
+    :return: distance beyond which a mc does not charge a sensor, either out of charge_ran or below charge_eps
+    """
+    if para.charge_eps <= 0:
+        return para.charge_ran
+    return max(0.0, min(para.charge_ran, (para.alpha / para.charge_eps) ** 0.5 - para.beta))
+
+
+def batch_com_func(net):
+    """
+    send the packages of every target firing in this second at once
+    :param net: the network
+    :return: True, the traced packages are kept in net.packages when net.trace is set
+    """
+    target_id = np.flatnonzero(net.target_mask)
+    draw = np.asarray([random.random() for _ in target_id])
+    state = net.node_state
+    source = target_id[(draw <= state.prob[target_id]) & state.is_active[target_id]]
+    debit, packages = forward_packages(net, source, package_size=net.package_size, trace=net.trace)
+    consume_energy(net, debit)
+    if net.trace:
+        net.packages = packages
+    return True
+
+
+def expected_com_func(net):
+    """
+    spend in this second the energy every sensor is expected to spend on traffic, without drawing random numbers
+    :param net: the network
+    :return: True
+    """
+    consume_energy(net, get_expected_drain(net))
+    return True
+
+
+def get_expected_drain(net):
+    """
+    :param net: the network
+    :return: energy every sensor is expected to spend per second, each active target firing with its probability
+    """
+    state = net.node_state
+    target_id = np.flatnonzero(net.target_mask & state.is_active)
+    debit, _ = forward_packages(net, target_id, package_size=net.package_size, weight=state.prob[target_id])
+    return debit
+
+
+def consume_energy(net, debit):
+    """
+    debit the energy spent on traffic and check which sensors are still alive
+    :param net: the network
+    :param debit: energy spent by every sensor
+    :return: None
+    """
+    state = net.node_state
+    touched = np.flatnonzero(debit)
+    state.energy[touched] -= debit[touched]
+    state.used_energy[touched] += debit[touched]
+    state.touch("energy", touched)
+    for node_id in touched:
+        net.node[node_id].check_active(net)
+
+
+def forward_packages(net, source, package_size, weight=None, trace=False):
+    """
+    route packages from their sources to the base hop by hop, all packages advancing together
+    :param net: the network
+    :param source: ids of the sensors sending a package
+    :param package_size: size of a package
+    :param weight: number of packages sent by each source, one by default
+    :param trace: if True, build a Package with its path for every source
+    :return: energy spent by every sensor, list of traced packages
+    """
+    routing = net.routing
+    routing.refresh()
+    source = np.asarray(source, dtype=int)
+    weight = np.ones(len(source)) if weight is None else np.asarray(weight, dtype=float)
+    debit = np.zeros(len(net.node))
+    packages = [Package(package_size=package_size) for _ in source] if trace else []
+    flow = np.arange(len(source))  # index of the package carried by each current sensor
+    current = source
+    while current.size:
+        if trace:
+            for index, node_id in zip(flow, current):
+                packages[index].update_path(int(node_id))
+        next_hop = routing.next_hop[current]
+        is_direct = routing.in_base_range[current]
+        is_sent = is_direct | (next_hop != -1)
+        np.add.at(debit, current[is_sent], routing.send_cost[current[is_sent]] * package_size * weight[flow[is_sent]])
+        if trace:
+            for index in flow[is_direct]:
+                packages[index].is_success = True
+                packages[index].update_path(-1)
+        is_forward = ~is_direct & (next_hop != -1)
+        current = next_hop[is_forward]
+        flow = flow[is_forward]
+        np.add.at(debit, current, para.ER * package_size * weight[flow])
+    return debit, packages
+
+
 def to_string(net):
     min_energy = 10 ** 10
     min_node = -1
@@ -31,20 +134,3 @@ def count_package_function(net):
         if package.path[-1] == -1:
             count += 1
     return count
-
-def set_checkpoint(t=0, network=None, optimizer=None, dead_time=0):
-    exp_index = int(network.experiment.split('_')[1])
-    exp_type = network.experiment.split('_')[0]
-    nb_run = int(network.experiment.split('_')[2])
-    checkpoint = {
-        'time'              : t,
-        'experiment_type'   : exp_type,
-        'experiment_index'  : exp_index,
-        'nb_run'            : nb_run,
-        'network'           : network,
-        'optimizer'         : optimizer,
-        'dead_time'         : dead_time
-    }
-    with open('checkpoint/checkpoint_{}_{}.pkl'.format(exp_type, exp_index), 'wb') as f:
-        pickle.dump(checkpoint, f)
-    print("[Simulator] Simulation checkpoint set at {}s".format(t))
\ No newline at end of file
@@ -1,13 +1,26 @@
-import math
 from scipy.spatial import distance
 
 from simulator.node.utils import to_string, find_receiver, request_function, estimate_average_energy
+from simulator.utils import state_property
 from simulator.network import parameter as para
+from simulator.network.routing import send_energy
 
 
 class Node:
+    energy = state_property("energy", float)
+    energy_max = state_property("energy_max", float)
+    energy_thresh = state_property("energy_thresh", float)
+    prob = state_property("prob", float)
+    used_energy = state_property("used_energy", float)
+    avg_energy = state_property("avg_energy", float)
+    is_active = state_property("is_active", bool)
+    is_request = state_property("is_request", bool)
+    level = state_property("level", int)
+
     def __init__(self, location=None, com_ran=None, sen_ran=None, energy=None, prob=para.prob, avg_energy=0.0,
                  len_cp=10, id=None, is_active=True, energy_max=None, energy_thresh=None):
+        self._state = None  # shared state of the network, set when the sensor is bound
+        self._row = None  # row of this sensor in the shared state
         self.location = location  # location of sensor
         self.com_ran = com_ran  # communication range
         self.sen_ran = sen_ran  # sensing range
@@ -25,6 +38,32 @@ class Node:
         self.is_request = False
         self.level = 0
 
+    @property
+    def check_point(self):
+        """
+        :return: list of the check points of the sensor, oldest first, a copy once the sensor is bound
+        """
+        if self._state is None:
+            return self.__dict__["check_point"]
+        return self._state.get_check_point_list(self._row)
+
+    @check_point.setter
+    def check_point(self, check_point):
+        if self._state is None:
+            self.__dict__["check_point"] = check_point
+        else:
+            self._state.set_check_point_list(self._row, check_point)
+
+    def bind(self, state, row):
+        """
+        turn the sensor into a view over one row of a shared state
+        :param state: NodeState of the network
+        :param row: row of this sensor in the state
+        :return: None
+        """
+        self._state = state
+        self._row = row
+
     def set_average_energy(self, func=estimate_average_energy):
         """
         calculate average energy of sensor
@@ -39,6 +78,9 @@ class Node:
         :param t: time stem
         :return: if queue of check point is not full, add new check point
         """
+        if self._state is not None:
+            self._state.set_check_point(self._row, t)
+            return
         if len(self.check_point) >= self.len_cp:
             self.check_point.pop(0)
         self.check_point.append(
@@ -46,15 +88,17 @@ class Node:
         self.avg_energy = self.check_point[-1]["avg_e"]
         self.used_energy = 0.0
 
-    def charge(self, mc):
+    def charge(self, mc, p_theory=None):
         """
         charging to sensor
         :param mc: mobile charger
+        :param p_theory: charge rate from the position of mc, computed from the distance if not given
         :return: the amount of energy mc charges to this sensor
         """
         if self.energy <= self.energy_max - 10 ** -5 and mc.is_stand and self.is_active:
-            d = distance.euclidean(self.location, mc.current)
-            p_theory = para.alpha / (d + para.beta) ** 2
+            if p_theory is None:
+                d = distance.euclidean(self.location, mc.current)
+                p_theory = para.alpha / (d + para.beta) ** 2
             p_actual = min(self.energy_max - self.energy, p_theory)
             self.energy = self.energy + p_actual
             return p_actual
@@ -70,21 +114,22 @@ class Node:
         :param is_energy_info: if this package is energy package, is_energy_info will be true
         :return: send package to the next node and reduce energy of this node
         """
-        d0 = math.sqrt(para.EFS / para.EMP)
         package.update_path(self.id)
-        if distance.euclidean(self.location, para.base) > self.com_ran:
+        if not net.routing.in_base_range[self.id]:
             receiver_id = receiver(self, net)
             if receiver_id != -1:
-                d = distance.euclidean(self.location, net.node[receiver_id].location)
-                e_send = para.ET + para.EFS * d ** 2 if d <= d0 else para.ET + para.EMP * d ** 4
+                if receiver is find_receiver:
+                    # the next hop of the routing table, whose link cost it keeps
+                    e_send = float(net.routing.send_cost[self.id])
+                else:
+                    e_send = float(send_energy(distance.euclidean(self.location, net.node[receiver_id].location)))
                 self.energy -= e_send * package.size
                 self.used_energy += e_send * package.size
                 net.node[receiver_id].receive(package)
                 net.node[receiver_id].send(net, package, receiver, is_energy_info)
         else:
             package.is_success = True
-            d = distance.euclidean(self.location, para.base)
-            e_send = para.ET + para.EFS * d ** 2 if d <= d0 else para.ET + para.EMP * d ** 4
+            e_send = float(net.routing.send_cost[self.id])
             self.energy -= e_send * package.size
             self.used_energy += e_send * package.size
             package.update_path(-1)
@@ -106,10 +151,12 @@ class Node:
         :return: None
         """
         if self.energy < 0 or len(self.neighbor) == 0:
-            self.is_active = False
+            is_active = False
         else:
-            a = [1 for neighbor in self.neighbor if net.node[neighbor].is_active]
-            self.is_active = True if len(a) > 0 else False
+            is_active = bool(net.node_state.is_active[self.neighbor].any())
+        if is_active != self.is_active:
+            self.is_active = is_active
+            net.routing.invalidate(self.id)
 
     def request(self, optimizer, t, request_func=request_function):
         """
@@ -0,0 +1,169 @@
+import numpy as np
+
+
+class NodeState:
+    def __init__(self, list_node):
+        """
+        structure-of-arrays storage for the mutable state of every sensor of a network
+        :param list_node: list of sensors, the i-th sensor is bound to row i
+        """
+        nb_node = len(list_node)
+        self.location = np.asarray([node.location for node in list_node], dtype=float).reshape(nb_node, 2)
+        self.energy = np.asarray([node.energy for node in list_node], dtype=float)
+        self.energy_max = np.asarray([node.energy_max for node in list_node], dtype=float)
+        self.energy_thresh = np.asarray([node.energy_thresh for node in list_node], dtype=float)
+        self.prob = np.asarray([node.prob for node in list_node], dtype=float)
+        self.used_energy = np.asarray([node.used_energy for node in list_node], dtype=float)
+        self.avg_energy = np.asarray([node.avg_energy for node in list_node], dtype=float)
+        self.is_active = np.asarray([node.is_active for node in list_node], dtype=bool)
+        self.is_request = np.asarray([node.is_request for node in list_node], dtype=bool)
+        self.level = np.asarray([node.level for node in list_node], dtype=int)
+        # check points as ring buffers, row i holds the last len_cp[i] check points of sensor i
+        self.len_cp = np.asarray([node.len_cp for node in list_node], dtype=int).reshape(nb_node)
+        size = int(self.len_cp.max(initial=1))
+        self.cp_energy = np.zeros((nb_node, size))
+        self.cp_time = np.zeros((nb_node, size))
+        self.cp_avg = np.zeros((nb_node, size))
+        self.cp_head = np.zeros(nb_node, dtype=int)  # column of the last check point
+        self.cp_count = np.zeros(nb_node, dtype=int)  # number of check points kept
+        for row, node in enumerate(list_node):
+            self.set_check_point_list(row, node.check_point)
+        for row, node in enumerate(list_node):
+            node.bind(self, row)
+        self.is_dead = self.energy <= 0  # as seen by nb_dead, repaired from the touched rows
+        self.nb_dead = int(np.count_nonzero(self.is_dead))
+        self.min_tree = MinTree(self.energy)
+        self.touched = np.zeros(nb_node, dtype=bool)  # rows whose energy changed since the last repair
+        self.is_touched = False
+        self.mean_avg_energy = None  # cached mean of avg_energy, None when it has to be recomputed
+
+    def __len__(self):
+        return len(self.energy)
+
+    def set_check_point_list(self, row, check_point):
+        """
+        :param row: row of the sensor
+        :param check_point: list of check points {"E_current", "time", "avg_e"}, oldest first
+        :return: None
+        """
+        check_point = check_point[-self.len_cp[row]:]
+        for column, point in enumerate(check_point):
+            self.cp_energy[row, column] = point["E_current"]
+            self.cp_time[row, column] = point["time"]
+            self.cp_avg[row, column] = point["avg_e"]
+        self.cp_head[row] = len(check_point) - 1
+        self.cp_count[row] = len(check_point)
+
+    def get_check_point_list(self, row):
+        """
+        :param row: row of the sensor
+        :return: list of check points {"E_current", "time", "avg_e"}, oldest first
+        """
+        check_point = []
+        for k in range(self.cp_count[row] - 1, -1, -1):
+            column = (self.cp_head[row] - k) % self.len_cp[row]
+            check_point.append({"E_current": float(self.cp_energy[row, column]),
+                                "time": self.cp_time[row, column].item(),
+                                "avg_e": float(self.cp_avg[row, column])})
+        return check_point
+
+    def get_last_check_point_time(self, rows):
+        return self.cp_time[rows, self.cp_head[rows]]
+
+    def get_last_avg_energy(self, rows):
+        return self.cp_avg[rows, self.cp_head[rows]]
+
+    def set_check_point(self, rows, t):
+        """
+        add a check point to some sensors, the oldest one is overwritten when the ring of a sensor is full
+        :param rows: row or array of rows of the sensors
+        :param t: time stem
+        :return: None, the average energy of the sensors becomes the one estimated by the new check point
+        """
+        avg_e = self.used_energy[rows] / (t - self.get_last_check_point_time(rows))
+        head = (self.cp_head[rows] + 1) % self.len_cp[rows]
+        self.cp_energy[rows, head] = self.energy[rows]
+        self.cp_time[rows, head] = t
+        self.cp_avg[rows, head] = avg_e
+        self.cp_head[rows] = head
+        self.cp_count[rows] = np.minimum(self.cp_count[rows] + 1, self.len_cp[rows])
+        self.avg_energy[rows] = avg_e
+        self.used_energy[rows] = 0.0
+        self.touch("avg_energy", rows)
+
+    def touch(self, name, rows):
+        """
+        record that a column changed, every write to energy or avg_energy has to be followed by a call
+        :param name: name of the column
+        :param rows: row or array of rows which changed
+        :return: None
+        """
+        if name == "energy":
+            self.touched[rows] = True
+            self.is_touched = True
+        elif name == "avg_energy":
+            self.mean_avg_energy = None
+
+    def repair(self):
+        if self.is_touched:
+            rows = np.flatnonzero(self.touched)
+            self.touched[rows] = False
+            self.is_touched = False
+            is_dead = self.energy[rows] <= 0
+            self.nb_dead += int(np.count_nonzero(is_dead)) - int(np.count_nonzero(self.is_dead[rows]))
+            self.is_dead[rows] = is_dead
+            self.min_tree.update(rows, self.energy[rows])
+
+    def get_nb_dead(self):
+        self.repair()
+        return self.nb_dead
+
+    def get_min_row(self):
+        """
+        :return: row of the lowest energy, the first one in case of ties as np.argmin
+        """
+        self.repair()
+        return self.min_tree.argmin()
+
+    def get_mean_avg_energy(self):
+        if self.mean_avg_energy is None:
+            self.mean_avg_energy = float(np.mean(self.avg_energy))
+        return self.mean_avg_energy
+
+
+class MinTree:
+    def __init__(self, value):
+        """
+        segment tree keeping the position of the minimum of an array, updated for many positions at once
+        :param value: initial values
+        """
+        self.size = 1 << max(0, (len(value) - 1).bit_length())
+        self.value = np.full(2 * self.size, np.inf)
+        self.index = np.full(2 * self.size, -1, dtype=int)
+        self.value[self.size:self.size + len(value)] = value
+        self.index[self.size:self.size + len(value)] = np.arange(len(value))
+        pos = np.arange(self.size // 2, self.size) if self.size > 1 else np.zeros(0, dtype=int)
+        while pos.size:
+            self._pull(pos)
+            pos = np.arange(pos[0] // 2, pos[0]) if pos[0] > 1 else pos[:0]
+
+    def _pull(self, pos):
+        left = 2 * pos
+        right = left + 1
+        # the left child wins ties, so that the smallest position of the minimum is kept
+        is_right = self.value[right] < self.value[left]
+        child = np.where(is_right, right, left)
+        self.value[pos] = self.value[child]
+        self.index[pos] = self.index[child]
+
+    def update(self, index, value):
+        pos = np.asarray(index, dtype=int) + self.size
+        self.value[pos] = value
+        pos = np.unique(pos // 2)
+        while pos.size and pos[-1] >= 1:
+            self._pull(pos)
+            pos = np.unique(pos[pos > 1] // 2)
+
+    def argmin(self):
+        return int(self.index[1])
+
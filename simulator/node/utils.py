@@ -1,9 +1,3 @@
-import numpy as np
-from scipy.spatial import distance
-
-from simulator.network import parameter as para
-
-
 def to_string(node):
     """
     print information of a node
@@ -37,31 +31,20 @@ def find_receiver(node, net):
     find receiver node
     :param node: node send this package
     :param net: network
-    :return: find node nearest base from neighbor of the node and return id of it
+    :return: find node nearest base from the active neighbors of lower level, read from the routing table of the network
     """
-    if not node.is_active:
-        return -1
-    candidate = [neighbor_id for neighbor_id in node.neighbor if
-                 net.node[neighbor_id].level < node.level and net.node[neighbor_id].is_active]
-    if candidate:
-        d = [distance.euclidean(net.node[candidate_id].location, para.base) for candidate_id in candidate]
-        id_min = np.argmin(d)
-        return candidate[id_min]
-    else:
-        return -1
+    return net.routing.get_next_hop(node.id)
 
 
 def request_function(node, optimizer, t):
     """
-    add a message to request list of mc.
+    add a message to request list of mc, or update the one the node already has.
     :param node: the node request
     :param mc: mobile charger
     :param t: time get request
     :return: None
     """
-    optimizer.list_request.append(
-        {"id": node.id, "energy": node.energy, "avg_energy": node.avg_energy, "energy_estimate": node.energy,
-         "time": t})
+    optimizer.list_request.push(node.id, node.energy, node.avg_energy, t)
 
 
 def estimate_average_energy(node):
@@ -70,4 +53,6 @@ def estimate_average_energy(node):
     user can replace with other function
     :return: a scalar which is calculated from check point list
     """
+    if node._state is not None:
+        return float(node._state.get_last_avg_energy(node._row))
     return node.check_point[-1]["avg_e"]
@@ -0,0 +1,31 @@
+def to_point(row):
+    """
+    :param row: array of the coordinates of a point
+    :return: the point as a tuple of python floats
+    """
+    return tuple(row.tolist())
+
+
+def state_property(name, cast):
+    """
+    expose one column of a structure-of-arrays state (NodeState, MCFleet) as an attribute of the bound object
+    :param name: name of the column
+    :param cast: python type of the attribute, or a function converting the row of the column
+    :return: property reading from the state row, or from the object itself while it is not bound; a state which
+    maintains values incrementally is told of every write through its touch(name, rows) method
+    """
+    def getter(obj):
+        if obj._state is None:
+            return obj.__dict__[name]
+        return cast(getattr(obj._state, name)[obj._row])
+
+    def setter(obj, value):
+        if obj._state is None:
+            obj.__dict__[name] = value
+        else:
+            getattr(obj._state, name)[obj._row] = value
+            touch = getattr(obj._state, "touch", None)
+            if touch is not None:
+                touch(name, obj._row)
+
+    return property(getter, setter)
@@ -0,0 +1,131 @@
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from scenario import get_experiment_row, get_nb_row
+from simulate import run_repetition
+from simulator.network import utils
+from simulator.network.checkpoint import get_checkpoint_prefix, list_checkpoint, load_checkpoint
+from simulator.network.plotter import PLOT_MODES
+
+FIELDNAMES = ["experiment_type", "experiment_index", "nb_run", "lifetime", "dead_node"]
+
+
+def parse_index(text, nb_row):
+    """
+    :param text: comma separated indexes or ranges such as "0-2,4", None for every row
+    :param nb_row: number of rows of the experiment file
+    :return: sorted list of row indexes
+    """
+    if text is None:
+        return list(range(nb_row))
+    index = set()
+    for item in text.split(','):
+        if '-' in item:
+            first, last = item.split('-')
+            index.update(range(int(first), int(last) + 1))
+        else:
+            index.add(int(item))
+    return sorted(i for i in index if 0 <= i < nb_row)
+
+
+def get_finished_job(output_file):
+    """
+    :param output_file: consolidated result file
+    :return: set of (experiment_type, experiment_index, nb_run) already written to it
+    """
+    if not os.path.exists(output_file):
+        return set()
+    with open(output_file, "r") as f:
+        return {(row["experiment_type"], int(row["experiment_index"]), int(row["nb_run"]))
+                for row in csv.DictReader(f)}
+
+
+def run_job(experiment_type, experiment_index, nb_run, plot=None, com_func=utils.uniform_com_func,
+            **optimizer_param):
+    """
+    run one repetition of one experiment row, resumed from its checkpoint if there is one
+    :return: result row of the job
+    """
+    if list_checkpoint(get_checkpoint_prefix(experiment_type, experiment_index, nb_run)):
+        checkpoint = load_checkpoint(experiment_type, experiment_index, nb_run)
+        print('[Sweep] Resuming experiment ({}, {}) repetition {}, at {}s.'.format(
+            experiment_type, experiment_index, nb_run, checkpoint['time']))
+        net = checkpoint['network']
+        life_time = net.simulate(optimizer=checkpoint['optimizer'], t=checkpoint['time'],
+                                 dead_time=checkpoint['dead_time'])
+    else:
+        experiment = get_experiment_row(experiment_type, experiment_index)
+        life_time = run_repetition(experiment, experiment_type, experiment_index, nb_run, plot=plot,
+                                   com_func=com_func, **optimizer_param)
+    return {"experiment_type": experiment_type, "experiment_index": experiment_index, "nb_run": nb_run,
+            "lifetime": life_time[0], "dead_node": life_time[1]}
+
+
+def sweep(experiment_types, index=None, nb_repetition=3, nb_worker=None, output_file="log/sweep.csv",
+          plot=None, com_func=utils.uniform_com_func, **optimizer_param):
+    """
+    run every (experiment, index, repetition) job which is not in output_file yet
+    :param experiment_types: names of the experiment files in ./data
+    :param index: rows to run, see parse_index
+    :param nb_repetition: number of repetitions of every row
+    :param nb_worker: number of worker processes, number of CPUs if None
+    :param output_file: consolidated result file, one row per job, appended as jobs finish
+    :param plot: plot mode of the new jobs, the plot_mode of parameter.py if None, resumed jobs keep the one of their
+    checkpoint
+    :param com_func: traffic model of the new jobs, resumed jobs keep the one of their checkpoint
+    :param optimizer_param: extra parameters of Q_learningv2 for the new jobs, e.g. recluster_period
+    :return: None
+    """
+    for folder in ['log', 'fig', 'checkpoint']:
+        os.makedirs(folder, exist_ok=True)
+
+    finished = get_finished_job(output_file)
+    jobs = []
+    for experiment_type in experiment_types:
+        nb_row = get_nb_row(experiment_type)
+        for experiment_index in parse_index(index, nb_row):
+            for nb_run in range(nb_repetition):
+                if (experiment_type, experiment_index, nb_run) not in finished:
+                    jobs.append((experiment_type, experiment_index, nb_run))
+    print('[Sweep] {} jobs to run, {} already finished'.format(len(jobs), len(finished)))
+    if not jobs:
+        return
+
+    is_new = not os.path.exists(output_file)
+    with open(output_file, "a", newline="") as output, ProcessPoolExecutor(max_workers=nb_worker) as executor:
+        writer = csv.DictWriter(output, fieldnames=FIELDNAMES)
+        if is_new:
+            writer.writeheader()
+        futures = {executor.submit(run_job, *job, plot=plot, com_func=com_func, **optimizer_param): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                writer.writerow(future.result())
+                output.flush()
+            except Exception as e:
+                print('[Sweep] Job {} failed: {}'.format(futures[future], e))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run experiment rows unattended on a pool of processes.')
+    parser.add_argument('experiment_types', nargs='+', help='experiment files in ./data, e.g. node target')
+    parser.add_argument('--index', default=None, help='rows to run, e.g. "0-2,4" (default: every row)')
+    parser.add_argument('--runs', type=int, default=3, help='number of repetitions of every row')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--output', default='log/sweep.csv', help='consolidated result file')
+    parser.add_argument('--plot', default=None, choices=PLOT_MODES,
+                        help='draw the clustering figures after each run, in a separate process, or not at all '
+                             '(default: plot_mode of parameter.py)')
+    parser.add_argument('--com-func', default='uniform_com_func', choices=utils.COM_FUNCS,
+                        help='traffic model, package by package or every package of a second at once')
+    parser.add_argument('--recluster-period', type=int, default=None,
+                        help='re-partition the charging positions every this many seconds (default: never)')
+    parser.add_argument('--recluster-drift', type=float, default=None,
+                        help='re-partition when this share of the clustering weight moved (default: never)')
+    parser.add_argument('--mini-batch', action='store_true', help='re-partition with mini-batch k-means')
+    args = parser.parse_args()
+    sweep(args.experiment_types, index=args.index, nb_repetition=args.runs, nb_worker=args.workers,
+          output_file=args.output, plot=args.plot, com_func=getattr(utils, args.com_func),
+          recluster_period=args.recluster_period,
+          recluster_drift=args.recluster_drift, mini_batch=args.mini_batch)